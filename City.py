@@ -1,34 +1,67 @@
 """Engine."""
 
+from array import array
+from concurrent.futures import ProcessPoolExecutor
 import datetime
 import json
 import os
-from copy import deepcopy
-from math import cos, radians, inf, e
-from random import choice, randint, random, randrange, sample
-from statistics import mean
+import pickle
+from math import inf, e
+from random import choice, getstate, random, randrange, sample, seed, setstate
 import csv
+import time
+
+import numpy as np
 
 from common import Position as Pos
 from Drone import Drone
+from Legs import Legs
+from Neighbours import Neighbours
+from Observer import Recorder
 from Parcel import Parcel
-import plots
+from Profiler import Profiler
+import binary
+import initializers
+import loaders
+import operators
+import schedules
+import shared
+
+DRONE_SPEC = ('drone_mass', 'max_capacity', 'max_speed', 'max_fuel', 'base_fuel_consumption',
+              'altitude', 'factor', 'waiting_at_base', 'waiting_at_client', 'split')
+
+
+worker_city = None # City of a worker process (see init_worker).
 
 
 class City():
     """Engine implementation and main interface."""
 
-    def __init__(self, position=Pos(0, 0), wind=(0, 0), metric='full'):
+    def __init__(self, position=Pos(0, 0), wind=(0, 0), metric='full',
+                 moves=tuple(operators.OPERATORS), initializer='random'):
         self.metric = metric
+        self.initializer = initializer
+        self.selector = operators.Selector(moves)
         self.scale = None
         self.solution = None
         self.position = position
         self.wind = wind
         self.drones = []
         self.parcels = []
+        self.legs = None
+        self.neighbours = None
+        self.placement = []
+        self.blocks = []
         self.total_cost = 0
+        self.costs = []
         self.best_total_cost = inf
-        self.total_costs = {'accepted' : [], 'attempted' : [], 'best' : []}
+        self.best_solution = (inf, None)
+        self.pending_best = None
+        self.iterations = 0
+        self.attempted_cost = 0
+        self.profile = None
+        self.recorder = Recorder()
+        self.observers = []
 
     def __add__(self, items):
         if isinstance(items, Drone) or isinstance(items, Parcel):
@@ -59,76 +92,236 @@ class City():
         return string
 
     def jload(self, json_file_name):
-        """Loads data from json .txt file stored in "test_json" folder."""
-        # TODO Add full drone spec.
-        with open(os.path.join("json_test", json_file_name)) as json_file:
-            data = json.load(json_file)
+        """Loads data from json .txt file (a name not found as given is looked up in "json_test"
+            folder, see loaders.resolve)."""
+        with open(loaders.resolve(json_file_name, "json_test")) as json_file:
+            self.load(json.load(json_file))
+
+    def load(self, data):
+        """Loads city parameters, drones and parcels from a dict (format of store). Drones are
+            based in the city; keys missing from their spec keep Drone defaults, null ones are
+            infinite (see dump)."""
         self.wind = tuple(data['wind'])
         self.position = Pos(data['position'][0], data['position'][1])
-        self.parcels = []
+        self.parcels = [Parcel(parcel['number'], Pos(parcel['x'], parcel['y']), parcel['weight'])
+                        for parcel in data['parcels']]
         self.drones = []
-        for parcel in data['parcels']:
-            self += Parcel(parcel['number'], Pos(parcel['x'], parcel['y']), parcel['weight'])
         for drone in data['drones']:
-            self += Drone(drone['number'], drone['max_capacity'], drone['max_speed'])
+            self += Drone(drone['number'], base=self.position, wind=self.wind,
+                          **{key : inf if drone[key] is None else drone[key]
+                             for key in DRONE_SPEC if key in drone})
 
     def rload(self, raw_file_name):
-        """Loads performance testing data from .txt file in raw format (used in test_tsp only)."""
-        with open(os.path.join("test_TSP", "raw_test", raw_file_name)) as raw_file:
-            data = raw_file.read().strip('\n')
-        self.solution = int(data.split('\n')[0])
-        self.parcels = []
-        for line in data.split('\n')[1:]:
-            parcel_number, pos_x, pos_y = line.split(' ')
-            self += Parcel(int(parcel_number), Pos(float(pos_x), float(pos_y)))
-            self.position = Pos(float(pos_x), float(pos_y)) # Base overlaps with last point.
+        """Loads performance testing data from .txt file in raw format (a name not found as
+            given is looked up in test_TSP/raw_test)."""
+        path = loaders.resolve(raw_file_name, os.path.join("test_TSP", "raw_test"))
+        self.solution, numbers, xs, ys = loaders.read(path)
+        self.place(numbers, xs, ys)
 
     def cload(self, coord_file_name):
-        """Loads data from GPS coordinates. The solutions are approximate due to conversion to
-            xy coordinates (used in test_tsp only)."""
-        with open(os.path.join("test_TSP", "coord_test", coord_file_name)) as coord_file:
-            data = coord_file.read().strip('\n')
-        self.solution = int(data.split('\n')[0])
-        self.parcels = []
-        th0 = mean(float(line.split(' ')[1]) for line in data.split('\n')[1:])
-        for line in data.split('\n')[1:]:
-            parcel_number, pos_x, pos_y = self.convert(line, th0)
-            self += Parcel(parcel_number, Pos(pos_x, pos_y))
-            self.position = Pos(pos_x, pos_y) # Base overlaps with last point.
-
-    def convert(self, line, th0):
-        """Converts a line into a tuple: (number, pox_x, pos_y)."""
-        parcel_number, latitude, longitude = line.split(' ')
-        earth_radius = 6371000
-        pos_x = round(earth_radius * radians(float(longitude)) * cos(radians(th0)))
-        pos_y = round(earth_radius * radians(float(latitude)))
-        return int(parcel_number), pos_x, pos_y
+        """Loads data from GPS coordinates (a name not found as given is looked up in
+            test_TSP/coord_test). The solutions are approximate due to conversion to xy
+            coordinates."""
+        path = loaders.resolve(coord_file_name, os.path.join("test_TSP", "coord_test"))
+        self.solution, numbers, latitudes, longitudes = loaders.read(path)
+        self.place(numbers, *loaders.project(latitudes, longitudes))
+
+    def place(self, numbers, xs, ys):
+        """Replaces parcels by ones with given numbers and coordinates (arrays)."""
+        positions = list(map(Pos._make, zip(xs.tolist(), ys.tolist())))
+        self.parcels = list(map(Parcel, numbers.tolist(), positions))
+        if positions:
+            self.position = positions[-1] # Base overlaps with last point.
 
     def store(self, json_file_name):
-        """Stores data (city parameters, drones and parcels) to json .txt file."""
-        # TODO Add whole drone spec.
+        """Stores data (city parameters, drones and parcels) to json .txt file (a bare file name
+            goes to "json_test" folder)."""
+        if not os.path.dirname(json_file_name):
+            json_file_name = os.path.join("json_test", json_file_name)
+        with open(json_file_name, 'w') as json_file:
+            json.dump(self.dump(), json_file, indent=4, allow_nan=False)
+
+    def dump(self):
+        """Returns city parameters, drones (whole spec) and parcels as a dict. Infinite drone
+            parameters (e.g. unlimited max_capacity) are given as None (null in JSON, which
+            has no infinity)."""
         data = {}
         data['wind'] = list(self.wind)
         data['position'] = [self.position.x, self.position.y]
         data['drones'] = []
         data['parcels'] = []
         for drone in self.drones:
-            data['drones'].append({"number" : drone.number,
-                                   "max_capacity" : drone.max_capacity,
-                                   "max_speed" : drone.max_speed})
+            spec = {"number" : drone.number}
+            spec.update((key, None if getattr(drone, key) == inf else getattr(drone, key))
+                        for key in DRONE_SPEC)
+            data['drones'].append(spec)
         for parcel in self.parcels:
             data['parcels'].append({"number" : parcel.number,
                                     "weight" : parcel.weight,
                                     "x" : parcel.position.x,
                                     "y" : parcel.position.y})
-        with open(os.path.join("json_test", json_file_name), 'w') as json_file:
-            json.dump(data, json_file, indent=4)
+        return data
+
+    def bstore(self, path, legs=False):
+        """Stores city parameters, drones, parcels and current routes (see routes) to a binary
+            file (see binary module). With legs=True legs tables are stored too (n^2 entries
+            each), so that processes loading the file share them instead of computing their
+            own."""
+        meta, arrays = self.pack()
+        if legs:
+            self.prepare_legs()
+            arrays.update(self.tables())
+        binary.write(path, meta, arrays)
+
+    def bload(self, path):
+        """Loads data stored by bstore: parcels, drones and their routes. Stored legs tables
+            stay memory mapped (rows of legs are views into the file, see Legs)."""
+        meta, arrays = binary.read(path)
+        self.unpack(meta, arrays)
+        if 'distances' in arrays:
+            self.legs = Legs(self.position, self.parcels, (arrays['distances'],
+                                                           arrays['headings']))
+            self.prepare_legs()
+
+    def pack(self, routes=True):
+        """Returns city parameters (a JSON-serializable dict) and NumPy arrays of parcels,
+            drones and (unless routes is False) current routes."""
+        meta = {'wind' : list(self.wind),
+                'position' : [self.position.x, self.position.y],
+                'solution' : self.solution,
+                'splits' : [drone.split for drone in self.drones]}
+        numeric = DRONE_SPEC[:-1] # All but split.
+        arrays = {
+            'parcel_numbers' : np.array([parcel.number for parcel in self.parcels], np.int64),
+            'parcel_positions' : np.array([parcel.position for parcel in self.parcels],
+                                          np.float64).reshape(-1, 2),
+            'parcel_weights' : np.array([parcel.weight for parcel in self.parcels], np.float64),
+            'drone_numbers' : np.array([drone.number for drone in self.drones], np.int64),
+            'drone_bases' : np.array([drone.base for drone in self.drones],
+                                     np.float64).reshape(-1, 2),
+            'drone_winds' : np.array([drone.wind for drone in self.drones],
+                                     np.float64).reshape(-1, 2),
+            'drone_specs' : np.array([[getattr(drone, key) for key in numeric]
+                                      for drone in self.drones],
+                                     np.float64).reshape(-1, len(numeric))}
+        if routes:
+            indices = {id(parcel) : index for index, parcel in enumerate(self.parcels, 1)}
+            tour = [indices[id(parcel)] for drone in self.drones for parcel in drone.parcels]
+            arrays['tour'] = np.array(tour, np.int32)
+            arrays['ends'] = np.cumsum([len(drone.parcels) for drone in self.drones],
+                                       dtype=np.int32)
+        return meta, arrays
+
+    def unpack(self, meta, arrays):
+        """Loads data returned by pack (drones without routes get no parcels). Drones keep
+            their own bases and winds (files without them are based in the city)."""
+        self.wind = tuple(meta['wind'])
+        self.solution = meta['solution']
+        positions = arrays['parcel_positions']
+        self.place(arrays['parcel_numbers'], positions[:, 0], positions[:, 1])
+        for parcel, weight in zip(self.parcels, arrays['parcel_weights'].tolist()):
+            parcel.weight = weight
+        self.position = Pos(*meta['position'])
+        numeric = DRONE_SPEC[:-1]
+        count = len(arrays['drone_numbers'])
+        bases = (list(map(Pos._make, arrays['drone_bases'].tolist())) if 'drone_bases' in arrays
+                 else [self.position] * count)
+        winds = (list(map(tuple, arrays['drone_winds'].tolist())) if 'drone_winds' in arrays
+                 else [self.wind] * count)
+        self.drones = [Drone(number, base=base, wind=wind, split=split,
+                             **dict(zip(numeric, spec)))
+                       for number, spec, split, base, wind in zip(arrays['drone_numbers'].tolist(),
+                                                                  arrays['drone_specs'].tolist(),
+                                                                  meta['splits'], bases, winds)]
+        if 'tour' not in arrays:
+            return
+        tour = arrays['tour']
+        start = 0
+        for drone, end in zip(self.drones, arrays['ends'].tolist()):
+            drone.parcels = [self.parcels[index - 1] for index in tour[start:end].tolist()]
+            start = end
+
+    def tables(self):
+        """Legs tables (distances and headings) as 2D NumPy arrays."""
+        size = len(self.legs)
+        return {'distances' : np.array(self.legs.distances, np.float64).reshape(size, size),
+                'headings' : np.array(self.legs.headings, np.float64).reshape(size, size)}
+
+    def share(self):
+        """Places the immutable part of the problem (parcels, drones, legs tables) in shared
+            memory once (see shared module). Returns a small picklable handle for attach in
+            other processes and the blocks, to be freed by shared.release(blocks, unlink=True)
+            once they are done."""
+        self.prepare_legs()
+        meta, arrays = self.pack(routes=False)
+        arrays.update(self.tables())
+        descriptors, blocks = shared.publish(arrays)
+        settings = {'metric' : self.metric, 'initializer' : self.initializer,
+                    'moves' : self.selector.names}
+        return {'meta' : meta, 'arrays' : descriptors, 'settings' : settings}, blocks
+
+    def attach(self, handle):
+        """Loads a problem shared by share (typically in a worker process). Legs tables stay
+            in shared memory, only parcel and drone objects and routes are private."""
+        arrays, self.blocks = shared.attach(handle['arrays'])
+        self.unpack(handle['meta'], arrays)
+        settings = handle['settings']
+        self.metric = settings['metric']
+        self.initializer = settings['initializer']
+        self.selector = operators.Selector(settings['moves'])
+        self.legs = Legs(self.position, self.parcels, (arrays['distances'], arrays['headings']))
+        self.prepare_legs()
 
     def prepare_algorithm(self):
         """Initialization procedure to prepare simulated annealing algorithm."""
-        self.reassign_parcels()
+        self.prepare_legs()
+        self.neighbours = Neighbours(self.parcels)
+        self.selector = operators.Selector(self.selector.names)
+        initializers.INITIALIZERS[self.initializer](self)
+        self.place_parcels()
         self.calculate_cost()
         self.calculate_scale()
+        self.best_total_cost = self.total_cost
+        self.best_solution = (self.total_cost, self.routes())
+        self.pending_best = None
+
+    def prepare_legs(self):
+        """Precomputes legs between base and parcels and shares them with drones based here.
+            Legs of the same positions and weights are kept (parcels only get their indices)."""
+        if self.legs is None or not self.legs.matches(self.position, self.parcels):
+            self.legs = Legs(self.position, self.parcels)
+        else:
+            for index, parcel in enumerate(self.parcels, 1):
+                parcel.index = index
+        for drone in self.drones:
+            drone.legs = self.legs if drone.base == self.position else None
+
+    def routes(self):
+        """Returns drones' routes in compact form: a giant tour of parcel indices (see Legs)
+            and, for every drone, the offset in the tour where its route ends."""
+        tour = array('i')
+        ends = array('i')
+        for drone in self.drones:
+            tour.extend(parcel.index for parcel in drone.parcels)
+            ends.append(len(tour))
+        return tour, ends
+
+    def set_routes(self, routes):
+        """Assigns parcels to drones according to routes in compact form (see routes)."""
+        tour, ends = routes
+        start = 0
+        for drone, end in zip(self.drones, ends):
+            drone.parcels = [self.parcels[index - 1] for index in tour[start:end]]
+            operators.track(self, drone, 0, len(drone.parcels))
+            start = end
+        self.calculate_cost()
+
+    def place_parcels(self):
+        """Records drone and position of every parcel (by parcel index), kept up to date by
+            moves (see operators.locate)."""
+        self.placement = [None] * (len(self.parcels) + 1)
+        for drone in self.drones:
+            operators.track(self, drone, 0, len(drone.parcels))
 
     def reassign_parcels(self):
         """Reassigns parcels among drones at random."""
@@ -140,49 +333,42 @@ class City():
 
     def calculate_cost(self):
         """Returns total distance or time covered by drones (depending on metric used)."""
+        self.costs = [self.drone_cost(drone) for drone in self.drones]
+        self.total_cost = sum(self.costs)
+        if self.observers:
+            self.notify('cost')
+
+    def drone_cost(self, drone):
+        """Returns a single drone's contribution to the total cost."""
         if self.metric == 'simple':
-            self.total_cost = sum(drone.path_length for drone in self.drones)
+            return drone.path_length
         if self.metric == 'full':
-            self.total_cost = sum(drone.total_time ** 2 for drone in self.drones)
             # Sum of squares kinda works; min as well. Sum of squares seems to be a bit better.
-            print(max(drone.total_time for drone in self.drones))
+            return drone.total_time ** 2
+        return 0
+
+    def update_cost(self, affected, deltas=None):
+        """Re-evaluates cached costs of affected drones only (given by their indices).
+
+            Cost deltas of the drones (parallel to affected), if known, are applied instead."""
+        if deltas is not None:
+            for index, delta in zip(affected, deltas):
+                self.costs[index] += delta
+                self.total_cost += delta
+            return
+        for index in dict.fromkeys(affected):
+            cost = self.drone_cost(self.drones[index])
+            self.total_cost += cost - self.costs[index]
+            self.costs[index] = cost
 
     def calculate_scale(self):
-        """Calculates scale according to data range."""
+        """Calculates scale according to data range (1 if parcels are all in one place, e.g. a
+            single one, as temperatures are divided by it)."""
         max_x = max([parcel.position.x for parcel in self.parcels])
         max_y = max([parcel.position.y for parcel in self.parcels])
         min_x = min([parcel.position.x for parcel in self.parcels])
         min_y = min([parcel.position.y for parcel in self.parcels])
-        self.scale = max(max_x - min_x, max_y - min_y) ** 2
-
-    def test_everything(self, iterations=1000, initial_temperature=10, final_temperature=0.001):
-        """Performs simulated annealing for all test cases and creates .txt file with summary."""
-        # XXX not used so far.
-        raw_test_cases = [f for f in os.listdir(os.path.join(os.getcwd(), "raw_test"))]
-        coord_test_cases = [f for f in os.listdir(os.path.join(os.getcwd(), "coord_test"))]
-        test_cases = raw_test_cases + coord_test_cases
-        print(test_cases)
-        test_file_name = datetime.datetime.now().strftime('%Y_%m_%d_%H_%M_%S.csv')
-        with open(os.path.join("test_results", test_file_name), 'w', newline='') as result_file:
-            csvwriter = csv.writer(result_file)
-            csvwriter.writerow(['iterations', 'initial_temperature', 'final_temperature'])
-            csvwriter.writerow([iterations, initial_temperature, final_temperature])
-            csvwriter.writerow(['test_case', 'result', 'solution', 'overshoot'])
-            for test_case in test_cases:
-                print("Testing", test_case)
-                if test_case in raw_test_cases:
-                    self.rload(test_case)
-                if test_case in coord_test_cases:
-                    self.cload(test_case)
-                self.full_simulated_annealing(iterations=iterations,
-                                              initial_temperature=initial_temperature,
-                                              final_temperature=final_temperature,
-                                              test=True)
-                print(test_case, round(self.total_cost), self.solution)
-                overshoot = round(100 * (self.total_cost - self.solution) / self.solution)
-                print('Overshoot', overshoot, '%')
-                csvwriter.writerow([test_case, str(round(self.total_cost)),
-                                    str(self.solution), str(overshoot)])
+        self.scale = max(max_x - min_x, max_y - min_y) ** 2 or 1
 
     def test_tsp(self, iterations=1000, initial_temperature=10, final_temperature=0.001):
         """Classic TSP with no drone spec or parcel weight considered (known solutions)."""
@@ -214,67 +400,434 @@ class City():
                                     str(self.solution), str(overshoot)])
 
     def full_simulated_annealing(self, initial_temperature=10, final_temperature=0.001,
-                                 iterations=10_000, test=False, show_solution=True):
-        """Loops over sim annealing."""
-        cooling_rate = pow(final_temperature / initial_temperature, 1 / iterations)
+                                 iterations=10_000, test=False, show_solution=True, every=100,
+                                 schedule='geometric', stop=(), checkpoint=None,
+                                 checkpoint_every=10_000, resume=False, profile=False):
+        """Loops over sim annealing.
+
+            schedule is a name from schedules.SCHEDULES (built from the temperatures and
+            iterations given, initial_temperature may be 'auto') or a schedules.Schedule
+            instance. Annealing ends when the schedule is finished or when any of stop
+            criteria (see schedules module) fires; their clocks start before preparation.
+            The best solution seen is applied to the city at the end. Other threads can read
+            it during the run (see best), new bests reach it within every iterations.
+
+            With a checkpoint path, state is saved every checkpoint_every iterations and at the
+            end (see save_checkpoint); resume=True continues from the checkpoint if it exists.
+
+            With profile=True, per-phase timers and per-operator counters of the annealing loop
+            are left in the profile attribute (see Profiler.report).
+
+            Observers (see Observer module) receive a 'sample' event every few iterations,
+            an 'improvement' event for every new best cost and a 'temperature' event whenever
+            temperature has halved since the last one (or has been raised). Cost history is
+            sampled by city.recorder only when it is registered, runs with plots (test=False)
+            register it themselves; with no observers the loop sends no events."""
+        if not test and self.recorder not in self.observers:
+            self.observers.append(self.recorder)
+        if isinstance(schedule, str):
+            schedule = schedules.SCHEDULES[schedule](initial_temperature, final_temperature,
+                                                     iterations)
+        self.notify('start', temperature=schedule.initial_temperature)
+        for criterion in stop:
+            criterion.start(self)
         self.prepare_algorithm()
-        plots.show_parcels(self, test=test)
-        plots.show_drone_paths(self, test=test, show_solution=show_solution)
+        if resume and checkpoint is not None and os.path.exists(checkpoint):
+            schedule = self.load_checkpoint(checkpoint)
+        else:
+            schedule.start(self)
+        if not test:
+            import plots # Headless runs (test=True) never import matplotlib.
+            plots.show_parcels(self)
+            plots.show_drone_paths(self, show_solution=show_solution)
         prev_best = self.total_cost
-        prev = self.total_cost
-        temperature = initial_temperature
-        while temperature > final_temperature:
-            self.iteration(temperature, test=test)
-            if not test:
-                print('Now', round(self.total_cost), 'Before', round(prev), 'Best',
-                      round(prev_best), 'Temp', temperature, '\n')
-            temperature *= cooling_rate
-            prev = self.total_cost
-            if self.total_cost < prev_best:
-                plots.show_drone_paths(self, test=test, show_solution=show_solution)
-                prev_best = self.total_cost
-        plots.show_drone_paths(self, final=True, test=test, show_solution=show_solution)
-        plots.show_distance_history(self, test=test)
-
-    def iteration(self, temperature, test=False):
-        """Performs one iteration of simulated annealing algorithm."""
-        # XXX needs slight refactoring.
-        previous_drones, previous_distance = self.save()
-        choice([choice(self.drones).twoopt, self.reinsert_parcel])()
+        reported_temperature = schedule.temperature
+        if profile:
+            profiler = Profiler()
+            profiler.attach(self)
+        try:
+            while not schedule.finished and not any(criterion(self) for criterion in stop):
+                temperature = schedule.temperature
+                accepted = self.iteration(temperature)
+                if self.iterations % every == 0:
+                    self.snapshot_best()
+                if self.observers:
+                    if self.iterations % every == 0:
+                        self.notify('sample', iteration=self.iterations, temperature=temperature,
+                                    attempted=self.attempted_cost, best=self.best_total_cost)
+                    if (temperature <= reported_temperature / 2 or
+                            temperature > reported_temperature):
+                        reported_temperature = temperature
+                        self.notify('temperature', iteration=self.iterations,
+                                    temperature=temperature)
+                improved = self.total_cost < prev_best
+                schedule.update(accepted, improved)
+                if improved:
+                    if not test:
+                        plots.show_drone_paths(self, show_solution=show_solution)
+                    prev_best = self.total_cost
+                    if self.observers:
+                        self.notify('improvement', iteration=self.iterations, best=prev_best)
+                if checkpoint is not None and self.iterations % checkpoint_every == 0:
+                    self.save_checkpoint(checkpoint, schedule)
+        finally:
+            if profile:
+                profiler.detach(self)
+        if profile:
+            self.profile = profiler.report()
+            self.profile['trip_cache'] = self.legs.cache.stats()
+        if checkpoint is not None:
+            self.save_checkpoint(checkpoint, schedule)
+        self.snapshot_best()
+        best_cost, best_routes = self.best_solution
+        if best_cost < self.total_cost:
+            self.set_routes(best_routes)
+        self.notify('end', iteration=self.iterations, best=self.best_total_cost)
+        if not test:
+            plots.show_drone_paths(self, final=True, show_solution=show_solution)
+            plots.show_distance_history(self)
+
+    def save_checkpoint(self, path, schedule):
+        """Saves annealing state (schedule with its temperature, RNG state, operator weights,
+            current and best routes) so that a killed run can be resumed. The file is replaced
+            atomically, a crash while writing leaves the previous checkpoint intact."""
+        state = {'parcels' : [parcel.number for parcel in self.parcels],
+                 'drones' : [drone.number for drone in self.drones],
+                 'schedule' : schedule,
+                 'random' : getstate(),
+                 'weights' : self.selector.weights,
+                 'iterations' : self.iterations,
+                 'best_total_cost' : self.best_total_cost,
+                 'routes' : self.routes(),
+                 'best_solution' : self.snapshot_best()}
+        with open(path + '.tmp', 'wb') as checkpoint_file:
+            pickle.dump(state, checkpoint_file)
+        os.replace(path + '.tmp', path)
+
+    def load_checkpoint(self, path):
+        """Restores state saved by save_checkpoint into a prepared city, returns the schedule."""
+        with open(path, 'rb') as checkpoint_file:
+            state = pickle.load(checkpoint_file)
+        if (state['parcels'] != [parcel.number for parcel in self.parcels] or
+                state['drones'] != [drone.number for drone in self.drones]):
+            raise ValueError('Checkpoint does not match the city.')
+        self.set_routes(state['routes'])
+        self.best_solution = state['best_solution']
+        self.pending_best = None
+        self.best_total_cost = state['best_total_cost']
+        self.iterations = state['iterations']
+        self.selector.weights = state['weights']
+        setstate(state['random'])
+        return state['schedule']
+
+    def multistart(self, chains=4, workers=None, seeds=None, **options):
+        """Runs independent simulated annealing chains in a process pool (distinct seeds).
+
+            Options are passed to full_simulated_annealing. Workers attach to the problem in
+            shared memory (see share). The best final solution is applied to the city.
+            Returns statistics of the best chain and of all chains."""
+        if seeds is None:
+            seeds = [randrange(2 ** 32) for _ in range(chains)]
+        options['test'] = True
+        handle, blocks = self.share()
+        try:
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                     initargs=(handle,)) as executor:
+                chains = list(executor.map(run_chain, seeds, [options] * len(seeds)))
+        finally:
+            shared.release(blocks, unlink=True)
+        best = min(chains, key=lambda chain: chain['cost'])
+        self.prepare_legs()
+        self.set_routes(best['routes'])
+        self.best_total_cost = min(chain['best_cost'] for chain in chains)
+        self.best_solution = (self.total_cost, best['routes'])
+        return best, chains
+
+    def parallel_tempering(self, replicas=4, initial_temperature=10, final_temperature=0.001,
+                           rounds=100, sweep=100, workers=None, swap_seed=None):
+        """Replica exchange: replicas on a geometric temperature ladder run sweeps of iterations
+            in worker processes and adjacent ones swap configurations after every round.
+
+            Workers attach to the problem in shared memory (see share). The best configuration
+            seen by any replica is applied to the city. Returns statistics (costs, temperature
+            ladder, swap acceptance rates)."""
+        self.prepare_algorithm()
+        ratio = pow(final_temperature / initial_temperature, 1 / max(1, replicas - 1))
+        temperatures = [initial_temperature * ratio ** i for i in range(replicas)]
+        states = []
+        for _ in temperatures:
+            self.reassign_parcels()
+            self.calculate_cost()
+            states.append((self.routes(), self.total_cost))
+        best_routes, best_cost = min(states, key=lambda state: state[1])
+        best_total_cost = best_cost
+        swaps = [[0, 0] for _ in range(replicas - 1)]
+        seed(swap_seed)
+        handle, blocks = self.share()
+        try:
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                     initargs=(handle,)) as executor:
+                for round_number in range(rounds):
+                    seeds = [randrange(2 ** 32) for _ in temperatures]
+                    results = list(executor.map(run_replica, [routes for routes, _ in states],
+                                                temperatures, [sweep] * replicas, seeds))
+                    states = [(routes, cost) for routes, cost, _ in results]
+                    bests = [best for _, _, best in results]
+                    best_total_cost = min([best_total_cost] + [cost for cost, _ in bests])
+                    cost, routes = min(bests, key=lambda best: best[0])
+                    if cost < best_cost:
+                        best_routes, best_cost = routes, cost
+                    for i in range(round_number % 2, replicas - 1, 2):
+                        delta = ((states[i][1] - states[i + 1][1]) / self.scale *
+                                 (1 / temperatures[i] - 1 / temperatures[i + 1]))
+                        swaps[i][1] += 1
+                        if e ** min(0, delta) > random():
+                            states[i], states[i + 1] = states[i + 1], states[i]
+                            swaps[i][0] += 1
+        finally:
+            shared.release(blocks, unlink=True)
+        self.set_routes(best_routes)
+        self.best_total_cost = min(self.best_total_cost, best_total_cost)
+        self.best_solution = (self.total_cost, best_routes)
+        return {'cost' : self.total_cost,
+                'best_cost' : best_total_cost,
+                'temperatures' : temperatures,
+                'swap_rates' : [accepted / attempted if attempted else 0
+                                for accepted, attempted in swaps]}
+
+    def add_parcels(self, parcels, iterations=1000, initial_temperature=0.01,
+                    final_temperature=0.001):
+        """Adds parcels to the current plan (incremental re-optimization, e.g. orders coming
+            in during the day): every parcel is inserted where it raises cost least, then drones
+            which got new parcels or carry their nearest neighbours are annealed briefly (see
+            local_annealing). Routes of other drones are kept as they are."""
+        if isinstance(parcels, Parcel):
+            parcels = [parcels]
+        self.prepare_incremental()
+        self.parcels.extend(parcels)
+        self.legs.extend(parcels)
+        self.placement.extend([None] * len(parcels))
+        self.neighbours.add(parcels)
+        self.calculate_scale()
+        affected = set()
+        for parcel in parcels:
+            affected.add(self.insert(parcel))
+            affected.update(self.carriers(self.neighbours.candidates[parcel.index]))
+        self.local_annealing(sorted(affected), iterations, initial_temperature,
+                             final_temperature)
+
+    def remove_parcels(self, parcels, iterations=1000, initial_temperature=0.01,
+                       final_temperature=0.001):
+        """Removes parcels (objects or numbers) from the current plan, then drones which
+            carried them are annealed briefly (see local_annealing)."""
+        if isinstance(parcels, Parcel):
+            parcels = [parcels]
+        numbers = {parcel.number : parcel for parcel in self.parcels}
+        removed = {parcel if isinstance(parcel, Parcel) else numbers[parcel] for parcel in parcels}
+        self.prepare_incremental()
+        affected = self.carriers(removed)
+        for index in affected:
+            drone = self.drones[index]
+            drone.parcels = [parcel for parcel in drone.parcels if parcel not in removed]
+        self.parcels = [parcel for parcel in self.parcels if parcel not in removed]
+        self.neighbours.remove(removed, self.parcels)
+        self.legs.remove(removed, self.parcels)
+        self.place_parcels()
+        if self.parcels:
+            self.calculate_scale()
+        self.update_cost(affected)
+        self.local_annealing(affected, iterations, initial_temperature, final_temperature)
+
+    def update_drone(self, number, iterations=1000, initial_temperature=0.01,
+                     final_temperature=0.001, **spec):
+        """Changes parameters of a drone (keys of DRONE_SPEC, e.g. max_fuel after a battery
+            swap), then the drone and drones carrying nearest neighbours of its parcels are
+            annealed briefly (see local_annealing)."""
+        unknown = set(spec) - set(DRONE_SPEC)
+        if unknown:
+            raise ValueError('Unknown drone parameters: ' + ', '.join(sorted(unknown)))
+        index = next((index for index, drone in enumerate(self.drones) if drone.number == number),
+                     None)
+        if index is None:
+            raise ValueError('Unknown drone: ' + str(number))
+        drone = self.drones[index]
+        for key, value in spec.items():
+            setattr(drone, key, value)
+        self.prepare_incremental()
+        self.update_cost([index])
+        affected = {index}
+        for parcel in drone.parcels:
+            affected.update(self.carriers(self.neighbours.candidates[parcel.index]))
+        self.local_annealing(sorted(affected), iterations, initial_temperature,
+                             final_temperature)
+
+    def prepare_incremental(self):
+        """Prepares legs, neighbours and cached costs of the current routes, unless they are
+            ready (parcels on no route are given to random drones, see initializers.keep)."""
+        if (self.neighbours is not None and len(self.costs) == len(self.drones) and
+                self.legs is not None and len(self.legs) == len(self.parcels) + 1):
+            return
+        self.prepare_legs()
+        self.neighbours = Neighbours(self.parcels)
+        initializers.keep(self)
+        self.place_parcels()
         self.calculate_cost()
-        self.total_costs['attempted'].append(self.total_cost)
+        if self.parcels:
+            self.calculate_scale()
+
+    def insert(self, parcel):
+        """Inserts a parcel into the route where it raises cost least. For every drone, the
+            position adding least distance is evaluated, cached costs of other drones are
+            kept. Returns the index of the drone."""
+        distances = self.legs.distances
+        best = (inf, None, None, None)
+        for index, drone in enumerate(self.drones):
+            stops = [0] + [other.index for other in drone.parcels] + [0]
+            detours = [distances[i][parcel.index] + distances[parcel.index][j] - distances[i][j]
+                       for i, j in zip(stops[:-1], stops[1:])]
+            position = detours.index(min(detours))
+            drone.parcels.insert(position, parcel)
+            cost = self.drone_cost(drone)
+            del drone.parcels[position]
+            if cost - self.costs[index] < best[0]:
+                best = (cost - self.costs[index], index, position, cost)
+        delta, index, position, cost = best
+        self.drones[index].parcels.insert(position, parcel)
+        operators.track(self, self.drones[index], position, position + 1)
+        self.costs[index] = cost
+        self.total_cost += delta
+        return index
+
+    def carriers(self, parcels):
+        """Indices of drones carrying any of given parcels."""
+        parcels = set(parcels)
+        return [index for index, drone in enumerate(self.drones)
+                if not parcels.isdisjoint(drone.parcels)]
+
+    def local_annealing(self, indices, iterations=1000, initial_temperature=0.01,
+                        final_temperature=0.001):
+        """Short geometric annealing warm-started from current routes and restricted to given
+            drones (moves never touch other drones). The best routes found are kept."""
+        drones, costs = self.drones, self.costs
+        self.drones = [drones[index] for index in indices]
+        self.costs = [costs[index] for index in indices]
+        self.total_cost = sum(self.costs)
+        self.best_solution = (self.total_cost, self.routes())
+        self.pending_best = None
+        schedule = schedules.Geometric(initial_temperature, final_temperature, iterations)
+        schedule.start(self)
+        try:
+            best = self.total_cost
+            while self.drones and not schedule.finished:
+                accepted = self.iteration(schedule.temperature)
+                schedule.update(accepted, self.total_cost < best)
+                best = min(best, self.total_cost)
+            best_cost, best_routes = self.snapshot_best()
+            if best_cost < self.total_cost:
+                self.set_routes(best_routes)
+        finally:
+            for index, cost in zip(indices, self.costs):
+                costs[index] = cost
+            self.drones, self.costs = drones, costs
+        self.total_cost = sum(costs)
+        self.best_total_cost = self.total_cost
+        self.best_solution = (self.total_cost, self.routes())
+
+    def notify(self, event, **data):
+        """Passes an event to registered observers (callables taking city, event and data)."""
+        for observer in self.observers:
+            observer(self, event, **data)
+
+    def iteration(self, temperature):
+        """Performs one iteration of simulated annealing algorithm.
+            Returns whether a move has been made (and accepted)."""
+        previous_distance = self.total_cost
+        operator = self.selector.choose()
+        affected, undo, deltas = self.selector.operators[operator](self)
+        previous_costs = [(index, self.costs[index]) for index in affected]
+        self.update_cost(affected, deltas)
+        self.iterations += 1
+        self.attempted_cost = self.total_cost
         if self.total_cost < self.best_total_cost:
             self.best_total_cost = self.total_cost
         improvement = previous_distance - self.total_cost
         acceptance = e ** min(100, improvement / (temperature * self.scale))
-        if not test:
-            print('Weird value:', acceptance)
-        if acceptance > random():
-            if not test:
-                print('Passed.')
-        else:
-            if not test:
-                print('Revert.')
-            self.revert(previous_drones)
-        self.total_costs['best'].append(self.best_total_cost)
-        self.total_costs['accepted'].append(self.total_cost)
-
-    def save(self):
-        """Save drones' state."""
-        return [deepcopy(drone) for drone in self.drones], self.total_cost
-
-    def revert(self, previous_drones):
-        """Reverts drones' state into previous state."""
-        for i in range(len(self.drones)):
-            self.drones[i] = previous_drones[i]
-        self.calculate_cost()
+        accepted = acceptance > random()
+        if not accepted:
+            self.revert(undo, previous_costs, previous_distance)
+        accepted = accepted and undo is not None
+        if accepted:
+            if self.total_cost < (self.best_solution[0] if self.pending_best is None
+                                  else self.pending_best):
+                self.pending_best = self.total_cost # Current routes, snapshot taken when left.
+            elif self.pending_best is not None:
+                operators.undo(self, undo)
+                self.snapshot_best()
+                operators.redo(self, undo)
+        self.selector.update(operator, accepted)
+        return accepted
+
+    def best(self):
+        """Returns the best solution snapshot (cost and routes, see routes); safe to call from
+            any thread at any time. A new best found by the annealing thread shows up once it
+            takes the snapshot (see snapshot_best)."""
+        return self.best_solution
+
+    def snapshot_best(self):
+        """Takes the snapshot of a pending new best and returns the best solution. Routes of
+            a new best are not copied on every improvement (iteration only notes their cost),
+            but when the search moves away from them, every sample of annealing or here. Only
+            the thread running the annealing may call it, as routes are read from the drones."""
+        if self.pending_best is not None:
+            # A new tuple is bound at once, so other threads always see a consistent snapshot.
+            self.best_solution = (self.pending_best, self.routes())
+            self.pending_best = None
+        return self.best_solution
+
+    def revert(self, undo, previous_costs, previous_distance):
+        """Undoes a move given its undo record and restores cached costs of affected drones."""
+        operators.undo(self, undo)
+        for index, cost in previous_costs:
+            self.costs[index] = cost
+        self.total_cost = previous_distance
+
+def run_chain(chain_seed, options):
+    """Runs a single simulated annealing chain (used by City.multistart worker processes)."""
+    city = worker_city
+    city.best_total_cost = inf
+    seed(chain_seed)
+    iterations = -city.iterations
+    start = time.perf_counter()
+    city.full_simulated_annealing(**options)
+    wall_time = time.perf_counter() - start
+    iterations += city.iterations
+    return {'seed' : chain_seed,
+            'cost' : city.total_cost,
+            'best_cost' : city.best_total_cost,
+            'iterations' : iterations,
+            'wall_time' : wall_time,
+            'iterations_per_second' : iterations / wall_time if wall_time else inf,
+            'profile' : city.profile,
+            'routes' : city.routes()}
+
+
+def init_worker(handle):
+    """Attaches a worker process to a shared problem (see City.share) and prepares it."""
+    global worker_city
+    worker_city = City()
+    worker_city.attach(handle)
+    worker_city.prepare_algorithm()
+
+
+def run_replica(routes, temperature, iterations, replica_seed):
+    """Runs a sweep of iterations at a fixed temperature starting from given routes.
+
+        Returns final routes, their cost and the best solution (cost, routes) of the sweep."""
+    seed(replica_seed)
+    worker_city.set_routes(routes)
+    worker_city.best_solution = (worker_city.total_cost, routes)
+    worker_city.pending_best = None
+    for _ in range(iterations):
+        worker_city.iteration(temperature)
+    return worker_city.routes(), worker_city.total_cost, worker_city.snapshot_best()
 
-    def reinsert_parcel(self):
-        """Moves a random parcel between two random drones."""
-        from_drone = choice(self.drones)
-        if not from_drone.parcels:
-            return
-        to_drone = choice(self.drones)
-        pop_index = randrange(0, len(from_drone.parcels))
-        insert_index = randint(0, len(to_drone.parcels))
-        to_drone.parcels.insert(insert_index, from_drone.parcels.pop(pop_index))
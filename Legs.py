@@ -0,0 +1,147 @@
+"""Provides precomputed legs between the base and parcels."""
+
+from array import array
+from math import atan2, cos, sin, sqrt
+
+from common import Position as Pos
+from common import dist
+from TripCache import TripCache
+
+
+class Legs(object):
+    """Pairwise distances and headings over base (index 0) and parcels (indices 1..n).
+
+        Parcels are given consecutive indices (stored in parcel.index), so every leg becomes a
+        lookup in distances[i][j] / headings[i][j]. Tables are shared by all drones of a city,
+        so are evaluated trips (cache, see Drone.trip). Wind components of every leg are
+        tabulated once per wind vector (see winds).
+
+        Coordinates (xs, ys) and weights are kept in typed columns and every table row is an
+        array('d') (8 bytes per leg instead of a float object and a pointer). Precomputed
+        tables (distances and headings as C-contiguous 2D NumPy arrays, e.g. in shared memory)
+        can be given instead; rows are then views into them, nothing is copied.
+
+        Parcels can be added and removed later (see extend and remove), only legs of added
+        parcels are computed."""
+
+    __slots__ = ('base', 'xs', 'ys', 'weights', 'distances', 'headings', 'arrays', 'cache',
+                 'wind_tables')
+
+    def __init__(self, base, parcels, tables=None):
+        self.base = base
+        positions = [base] + [parcel.position for parcel in parcels]
+        self.xs = array('d', [position.x for position in positions])
+        self.ys = array('d', [position.y for position in positions])
+        self.weights = array('d', [parcel.weight for parcel in parcels]) # Trips depend on them.
+        for index, parcel in enumerate(parcels, 1):
+            parcel.index = index
+        if tables is not None:
+            self.distances, self.headings = [self.rows(table) for table in tables]
+            self.arrays = tables
+        else:
+            self.distances = [array('d', [dist(start, end) for end in positions])
+                              for start in positions]
+            self.headings = [array('d', [atan2(end.y - start.y, end.x - start.x)
+                                         for end in positions])
+                             for start in positions]
+            self.arrays = None
+        self.cache = TripCache()
+        self.wind_tables = {}
+
+    def __len__(self):
+        return len(self.xs)
+
+    @property
+    def positions(self):
+        """Positions of base and parcels (in order of indices)."""
+        return list(map(Pos, self.xs, self.ys))
+
+    def matches(self, base, parcels):
+        """Whether legs were computed for given base and parcels (positions and weights)."""
+        return (len(self) == len(parcels) + 1 and
+                self.xs == array('d', [base.x] + [parcel.position.x for parcel in parcels]) and
+                self.ys == array('d', [base.y] + [parcel.position.y for parcel in parcels]) and
+                self.weights == array('d', [parcel.weight for parcel in parcels]))
+
+    def rows(self, table):
+        """Rows of a square table as flat memoryviews (indexing them gives Python floats)."""
+        flat = memoryview(table).cast('B').cast('d')
+        size = len(self)
+        return [flat[start:start + size] for start in range(0, size * size, size)]
+
+    def winds(self, wind):
+        """Tailwinds (wind component along the leg) and squared crosswinds of all legs for a
+            wind vector. Tables are asymmetric (a tailwind from A to B is a headwind from B to A)
+            and are computed on first use only, so ground speed needs no trigonometry later."""
+        wind = tuple(wind)
+        tables = self.wind_tables.get(wind)
+        if tables is None:
+            rows = [components(wind, row) for row in self.headings]
+            tables = self.wind_tables[wind] = ([row[0] for row in rows], [row[1] for row in rows])
+        return tables
+
+    def extend(self, parcels):
+        """Adds legs of new parcels (given the next indices). Existing legs and cached trips
+            are kept."""
+        self.unshare()
+        start = len(self)
+        for index, parcel in enumerate(parcels, start):
+            parcel.index = index
+        origins = self.positions
+        added = [parcel.position for parcel in parcels]
+        positions = origins + added
+        self.xs.extend(position.x for position in added)
+        self.ys.extend(position.y for position in added)
+        self.weights.extend(parcel.weight for parcel in parcels)
+        for origin, row in zip(origins, self.distances):
+            row.extend(dist(origin, end) for end in added)
+        self.distances.extend(array('d', [dist(origin, end) for end in positions])
+                              for origin in added)
+        for origin, row in zip(origins, self.headings):
+            row.extend(atan2(end.y - origin.y, end.x - origin.x) for end in added)
+        self.headings.extend(array('d', [atan2(end.y - origin.y, end.x - origin.x)
+                                         for end in positions])
+                             for origin in added)
+        for wind, (tailwinds, crosswinds) in self.wind_tables.items():
+            for row, tailwind_row, crosswind_row in zip(self.headings, tailwinds, crosswinds):
+                tailwind, crosswind = components(wind, row[len(tailwind_row):])
+                tailwind_row.extend(tailwind)
+                crosswind_row.extend(crosswind)
+            for row in self.headings[start:]:
+                tailwind, crosswind = components(wind, row)
+                tailwinds.append(tailwind)
+                crosswinds.append(crosswind)
+
+    def remove(self, parcels, remaining):
+        """Drops legs of parcels; remaining parcels (in order of their indices) are given
+            consecutive indices again. Cached trips are dropped (they refer to indices)."""
+        self.unshare()
+        removed = {parcel.index for parcel in parcels}
+        kept = [index for index in range(len(self)) if index not in removed]
+        self.xs = array('d', [self.xs[index] for index in kept])
+        self.ys = array('d', [self.ys[index] for index in kept])
+        self.weights = array('d', [self.weights[index - 1] for index in kept[1:]])
+        tables = [self.distances, self.headings]
+        for wind_tables in self.wind_tables.values():
+            tables.extend(wind_tables)
+        for table in tables:
+            table[:] = [array('d', [table[i][j] for j in kept]) for i in kept]
+        for index, parcel in enumerate(remaining, 1):
+            parcel.index = index
+        self.cache.clear()
+
+    def unshare(self):
+        """Makes tables private before they are changed (rows may be views into arrays, see
+            rows)."""
+        if self.arrays is not None:
+            self.distances = [array('d', row) for row in self.distances]
+            self.headings = [array('d', row) for row in self.headings]
+            self.arrays = None
+
+
+def components(wind, headings):
+    """Tailwinds and squared crosswinds of legs of given headings."""
+    wind_speed = sqrt(wind[0] ** 2 + wind[1] ** 2)
+    angle = atan2(wind[1], wind[0])
+    return (array('d', [wind_speed * cos(abs(angle - heading)) for heading in headings]),
+            array('d', [wind_speed ** 2 * sin(abs(angle - heading)) ** 2 for heading in headings]))
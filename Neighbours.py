@@ -0,0 +1,129 @@
+"""Provides spatial index over parcels with k-nearest candidate lists."""
+
+from math import ceil, floor, inf, sqrt
+
+from common import dist
+
+
+class Neighbours(object):
+    """Uniform grid over parcel positions (about two parcels per cell).
+
+        candidates[parcel.index] lists the k parcels nearest to a parcel (closest first); move
+        generators use them to propose only geometrically plausible changes. Requires parcel
+        indices (see Legs).
+
+        Parcels can be added and removed later (see add and remove), only candidate lists which
+        change are searched again. reach bounds the distance of every parcel to its farthest
+        candidate, so a new parcel can only enter lists of parcels within reach of it."""
+
+    __slots__ = ('k', 'reach', 'cell', 'min_x', 'min_y', 'grid', 'candidates')
+
+    def __init__(self, parcels, k=8):
+        self.k = k
+        self.reach = 0
+        self.grid = {}
+        self.candidates = [[] for _ in range(len(parcels) + 1)]
+        if not parcels:
+            return
+        xs = [parcel.position.x for parcel in parcels]
+        ys = [parcel.position.y for parcel in parcels]
+        self.min_x, self.min_y = min(xs), min(ys)
+        area = (max(xs) - self.min_x) * (max(ys) - self.min_y)
+        width = max(max(xs) - self.min_x, max(ys) - self.min_y)
+        self.cell = sqrt(2 * area / len(parcels)) or width / len(parcels) or 1
+        for parcel in parcels:
+            self.grid.setdefault(self.key(parcel.position), []).append(parcel)
+        for parcel in parcels:
+            self.candidates[parcel.index] = self.nearest(parcel.position, k, parcel)
+        self.reach = max(self.extent(parcel.position, self.candidates[parcel.index])
+                         for parcel in parcels)
+
+    def add(self, parcels):
+        """Adds parcels (given the next indices, see Legs.extend). The grid keeps its cells;
+            lists of parcels within reach of new ones only take them in where they are nearer
+            than the farthest candidate."""
+        if not self.grid:
+            self.__init__(parcels, self.k)
+            return
+        self.candidates.extend([] for _ in parcels)
+        for parcel in parcels:
+            self.grid.setdefault(self.key(parcel.position), []).append(parcel)
+        added = set(parcels)
+        for parcel in parcels:
+            for other in self.around(parcel.position, self.reach):
+                if other in added:
+                    continue
+                candidates = self.candidates[other.index]
+                distances = [dist(other.position, candidate.position) for candidate in candidates]
+                distance = dist(other.position, parcel.position)
+                if len(candidates) < self.k or distance < distances[-1]:
+                    position = next((i for i, d in enumerate(distances) if d > distance),
+                                    len(candidates))
+                    candidates.insert(position, parcel)
+                    del candidates[self.k:]
+        for parcel in parcels:
+            self.candidates[parcel.index] = self.nearest(parcel.position, self.k, parcel)
+            self.reach = max(self.reach,
+                             self.extent(parcel.position, self.candidates[parcel.index]))
+
+    def remove(self, parcels, remaining):
+        """Removes parcels (a set) before the remaining ones are given new indices (see
+            Legs.remove, remaining in order of their indices). Only lists which held removed
+            parcels are searched again."""
+        for parcel in parcels:
+            key = self.key(parcel.position)
+            self.grid[key].remove(parcel)
+            if not self.grid[key]:
+                del self.grid[key]
+        self.candidates = [[]] + [self.candidates[parcel.index] for parcel in remaining]
+        for index, parcel in enumerate(remaining, 1):
+            if not parcels.isdisjoint(self.candidates[index]):
+                self.candidates[index] = self.nearest(parcel.position, self.k, parcel)
+                self.reach = max(self.reach,
+                                 self.extent(parcel.position, self.candidates[index]))
+
+    def extent(self, position, candidates):
+        """Distance to the farthest of candidates (infinite if there are less than k)."""
+        if len(candidates) < self.k:
+            return inf
+        return dist(position, candidates[-1].position)
+
+    def around(self, position, radius):
+        """Parcels in cells which may hold parcels within radius of a position."""
+        if radius == inf:
+            return [parcel for cell in self.grid.values() for parcel in cell]
+        center_x, center_y = self.key(position)
+        span = ceil(radius / self.cell)
+        if (2 * span + 1) ** 2 > len(self.grid):
+            return [parcel for (cell_x, cell_y), cell in self.grid.items()
+                    if abs(cell_x - center_x) <= span and abs(cell_y - center_y) <= span
+                    for parcel in cell]
+        return [parcel for cell_x in range(center_x - span, center_x + span + 1)
+                for cell_y in range(center_y - span, center_y + span + 1)
+                for parcel in self.grid.get((cell_x, cell_y), ())]
+
+    def key(self, position):
+        """Grid cell of a position."""
+        return (floor((position.x - self.min_x) / self.cell),
+                floor((position.y - self.min_y) / self.cell))
+
+    def nearest(self, position, k, exclude=None):
+        """Up to k parcels nearest to a position (closest first), searching rings of cells."""
+        center_x, center_y = self.key(position)
+        total = len(self.candidates) - 1 - (exclude is not None)
+        found = []
+        radius = 0
+        while True:
+            for cell_x in range(center_x - radius, center_x + radius + 1):
+                for cell_y in range(center_y - radius, center_y + radius + 1):
+                    if max(abs(cell_x - center_x), abs(cell_y - center_y)) != radius:
+                        continue
+                    for parcel in self.grid.get((cell_x, cell_y), ()):
+                        if parcel is not exclude:
+                            found.append((dist(position, parcel.position), parcel))
+            found.sort(key=lambda item: item[0])
+            # Every parcel closer than radius * cell lies in the rings searched so far.
+            if len(found) >= k and found[k - 1][0] <= radius * self.cell or len(found) == total:
+                break
+            radius += 1
+        return [parcel for _, parcel in found[:k]]
@@ -0,0 +1,65 @@
+"""Provides progress observers for simulated annealing."""
+
+from array import array
+
+
+class Observer(object):
+    """Base observer. City.notify calls it with (city, event, **data) and it dispatches the event
+        to the on_<event> method, if defined.
+
+        Events sent by City.full_simulated_annealing: 'start', 'sample' (every k iterations),
+        'improvement' (new best cost), 'temperature' (temperature halved or raised) and 'end'."""
+
+    def __call__(self, city, event, **data):
+        handler = getattr(self, 'on_' + event, None)
+        if handler is not None:
+            handler(city, **data)
+
+
+class Recorder(Observer):
+    """Records sampled cost history in typed arrays of bounded size.
+
+        Whenever capacity is reached, every other record is dropped and only every other
+        subsequent sample is kept (so memory stays flat on arbitrarily long runs)."""
+
+    def __init__(self, capacity=10_000):
+        self.capacity = capacity
+        self.stride = 1
+        self.samples = 0
+        self.iterations = array('q')
+        self.history = {'accepted' : array('d'), 'attempted' : array('d'), 'best' : array('d')}
+
+    def on_start(self, city, **data):
+        self.__init__(self.capacity)
+
+    def on_sample(self, city, iteration, attempted, best, **data):
+        self.samples += 1
+        if (self.samples - 1) % self.stride:
+            return
+        self.iterations.append(iteration)
+        self.history['accepted'].append(city.total_cost)
+        self.history['attempted'].append(attempted)
+        self.history['best'].append(best)
+        if len(self.iterations) >= self.capacity:
+            del self.iterations[1::2]
+            for values in self.history.values():
+                del values[1::2]
+            self.stride *= 2
+
+
+class Console(Observer):
+    """Prints sampled progress to the console."""
+
+    def on_sample(self, city, iteration, attempted, best, temperature, **data):
+        print('Iteration', iteration, 'Now', round(city.total_cost), 'Attempted',
+              round(attempted), 'Best', round(best), 'Temp', temperature)
+
+    def on_improvement(self, city, iteration, best, **data):
+        print('Iteration', iteration, 'New best', round(best))
+
+    def on_temperature(self, city, iteration, temperature, **data):
+        print('Iteration', iteration, 'Temp', temperature)
+
+    def on_cost(self, city, **data):
+        if city.metric == 'full' and city.costs:
+            print('Longest drone time', max(city.costs) ** 0.5)
@@ -3,10 +3,13 @@
 class Parcel(object):
     """Provides parcel implementation."""
 
+    __slots__ = ('number', 'position', 'weight', 'index')
+
     def __init__(self, number, position, weight=0):
         self.number = number
         self.position = position
         self.weight = weight
+        self.index = None
 
     def __str__(self):
         string = '{:>20}'.format(self.number)
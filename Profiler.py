@@ -0,0 +1,122 @@
+"""Provides low-overhead instrumentation of simulated annealing."""
+
+import time
+
+
+class Profiler(object):
+    """Per-phase cumulative timers and per-operator counters (proposed, accepted and improving
+        moves) of simulated annealing.
+
+        attach wraps operators, cost updates, reverts and iterations of a prepared city in
+        instance attributes and detach removes them again, so nothing is paid when profiling
+        is off. Phases: move (generating and applying moves), cost (cost updates), revert
+        (undoing rejected moves), acceptance (the rest of iterations: choice of operator,
+        acceptance test and best solution snapshots) and loop (schedule, stopping criteria,
+        observers and checkpoints). Evaluations count drone costs computed in full (their trips
+        may still come from the trip cache, whose statistics City adds to the report)."""
+
+    def __init__(self):
+        self.times = {'move' : 0.0, 'cost' : 0.0, 'revert' : 0.0, 'iteration' : 0.0}
+        self.counters = {}
+        self.iterations = 0
+        self.evaluations = 0
+        self.current = None
+        self.started = None
+        self.wall_time = 0.0
+
+    def attach(self, city):
+        """Starts profiling a city."""
+        selector = city.selector
+        self.counters = {name : {'proposed' : 0, 'accepted' : 0, 'improved' : 0}
+                         for name in selector.names}
+        self.originals = selector.operators
+        selector.operators = [self.move(name, operator)
+                              for name, operator in zip(selector.names, selector.operators)]
+        selector.update = self.update(selector.names, selector.update)
+        city.update_cost = self.cost(city, city.update_cost)
+        city.drone_cost = self.evaluation(city.drone_cost)
+        city.revert = self.timed('revert', city.revert)
+        city.iteration = self.iteration(city.iteration)
+        self.started = time.perf_counter()
+
+    def detach(self, city):
+        """Stops profiling a city."""
+        self.wall_time += time.perf_counter() - self.started
+        city.selector.operators = self.originals
+        del city.selector.update
+        for name in ('update_cost', 'drone_cost', 'revert', 'iteration'):
+            delattr(city, name)
+
+    def timed(self, phase, function):
+        """Function adding its running time to a phase."""
+        times = self.times
+        clock = time.perf_counter
+        def wrapper(*args):
+            start = clock()
+            result = function(*args)
+            times[phase] += clock() - start
+            return result
+        return wrapper
+
+    def move(self, name, operator):
+        """Operator timed as the move phase, counting its proposals (and remembering its
+            counters for cost)."""
+        timed = self.timed('move', operator)
+        counters = self.counters[name]
+        def wrapper(city):
+            self.current = counters
+            counters['proposed'] += 1
+            return timed(city)
+        return wrapper
+
+    def update(self, names, update):
+        """Selector.update counting accepted moves of every operator."""
+        counters = [self.counters[name] for name in names]
+        def wrapper(index, accepted):
+            counters[index]['accepted'] += accepted
+            update(index, accepted)
+        return wrapper
+
+    def cost(self, city, update_cost):
+        """City.update_cost timed as the cost phase, counting improving moves of the current
+            operator."""
+        timed = self.timed('cost', update_cost)
+        def wrapper(affected, deltas=None):
+            before = city.total_cost
+            timed(affected, deltas)
+            if city.total_cost < before:
+                self.current['improved'] += 1
+        return wrapper
+
+    def evaluation(self, drone_cost):
+        """City.drone_cost counting evaluations."""
+        def wrapper(drone):
+            self.evaluations += 1
+            return drone_cost(drone)
+        return wrapper
+
+    def iteration(self, iteration):
+        """City.iteration timed as a whole, counting iterations."""
+        timed = self.timed('iteration', iteration)
+        def wrapper(temperature):
+            self.iterations += 1
+            return timed(temperature)
+        return wrapper
+
+    def report(self):
+        """Collected data as a JSON-serializable dict."""
+        times = self.times
+        wall_time = self.wall_time or 1e-12
+        phases = {'move' : times['move'],
+                  'cost' : times['cost'],
+                  'revert' : times['revert'],
+                  'acceptance' : times['iteration'] - times['move'] - times['cost'] -
+                                 times['revert'],
+                  'loop' : self.wall_time - times['iteration']}
+        return {'wall_time' : self.wall_time,
+                'iterations' : self.iterations,
+                'iterations_per_second' : self.iterations / wall_time,
+                'evaluations' : self.evaluations,
+                'evaluations_per_second' : self.evaluations / wall_time,
+                'phases' : phases,
+                'operators' : self.counters}
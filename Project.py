@@ -16,6 +16,8 @@ city += Drone(1, max_capacity=24000, max_speed=16, base=city.position)
 city += Drone(2, max_capacity=24000, max_speed=8, base=city.position)
 
 # Computations
+# from Observer import Console; city.observers.append(Console()) # Prints sampled progress.
+# city.observers.append(city.recorder) # Records cost history (plotted runs do it themselves).
 city.full_simulated_annealing(iterations=10000, initial_temperature=10, final_temperature=0.0001, show_solution=False)
 
 # city.test_tsp(iterations=1000, initial_temperature=10000000, final_temperature=1000)
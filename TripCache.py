@@ -0,0 +1,51 @@
+"""Provides bounded memo of trip evaluations."""
+
+from collections import OrderedDict
+
+
+class TripCache(object):
+    """Least recently used cache of trip results with hit and miss statistics.
+
+        Keys are (drone spec, parcel indices of the trip), so drones with identical specs share
+        entries. Every legs table holds its own cache (indices are only meaningful there)."""
+
+    __slots__ = ('maxsize', 'entries', 'hits', 'misses')
+
+    def __init__(self, maxsize=100_000):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, compute, *args):
+        """Cached value for a key, computed as compute(*args) on a miss."""
+        entries = self.entries
+        try:
+            value = entries[key]
+        except KeyError:
+            self.misses += 1
+            value = entries[key] = compute(*args)
+            if len(entries) > self.maxsize:
+                entries.popitem(last=False)
+            return value
+        self.hits += 1
+        entries.move_to_end(key)
+        return value
+
+    def clear(self):
+        """Drops all entries and statistics."""
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        """Size and hit/miss statistics as a dict."""
+        lookups = self.hits + self.misses
+        return {'size' : len(self.entries),
+                'maxsize' : self.maxsize,
+                'hits' : self.hits,
+                'misses' : self.misses,
+                'hit_rate' : self.hits / lookups if lookups else 0}
@@ -0,0 +1,90 @@
+"""Batch solving of many problems in one process pool.
+
+    Problems are dicts in the City.store format or paths of such JSON files. Workers are
+    started once and reused for all problems; results are yielded as they complete:
+
+        for result in batch.solve(['depot1.json', 'depot2.json'], budget=2):
+            print(result['problem'], result['cost'])
+
+    From the command line every result is printed as a line of JSON:
+
+        python batch.py depot1.json depot2.json --budget 2 --workers 8"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import json
+from random import seed
+import sys
+import time
+
+from City import City
+import schedules
+
+
+def load(problem):
+    """City for a problem given as a dict or a path of a JSON file."""
+    if isinstance(problem, str):
+        with open(problem) as json_file:
+            problem = json.load(json_file)
+    city = City()
+    city.load(problem)
+    return city
+
+
+def run(index, problem, budget, job_seed, options):
+    """Solves a single problem (in a worker process). Errors are reported, not raised, so that
+        one broken problem does not stop the batch."""
+    start = time.perf_counter()
+    result = {'index' : index, 'problem' : problem if isinstance(problem, str) else index}
+    try:
+        seed(job_seed)
+        city = load(problem)
+        options = dict(options, test=True)
+        if budget is not None:
+            options['stop'] = list(options.get('stop', ())) + [schedules.WallClock(budget)]
+        city.full_simulated_annealing(**options)
+    except Exception as error:
+        result['error'] = repr(error)
+    else:
+        result['cost'] = city.total_cost
+        result['iterations'] = city.iterations
+        result['routes'] = {drone.number : [parcel.number for parcel in drone.parcels]
+                            for drone in city.drones}
+    result['wall_time'] = time.perf_counter() - start
+    return result
+
+
+def solve(problems, workers=None, budget=None, base_seed=None, **options):
+    """Solves problems concurrently and yields results as they complete (in any order).
+
+        budget is a number of seconds per problem (or a list of them, one per problem), the
+        wall-clock stopping criterion is added to any given in options. With base_seed, problem
+        i is seeded with base_seed + i. Other options are passed to full_simulated_annealing.
+        Every result holds index and problem (its path, or index for a dict), then either
+        cost, iterations and routes (parcel numbers by drone number), or error; and wall_time."""
+    problems = list(problems)
+    budgets = budget if isinstance(budget, (list, tuple)) else [budget] * len(problems)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run, index, problem, budgets[index],
+                                   None if base_seed is None else base_seed + index, options)
+                   for index, problem in enumerate(problems)]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def main(arguments=None):
+    """Command line interface."""
+    parser = argparse.ArgumentParser(description='Solves problems stored in JSON files.')
+    parser.add_argument('problems', nargs='+')
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--budget', type=float, help='seconds per problem')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--iterations', type=int, default=10_000)
+    options = parser.parse_args(arguments)
+    for result in solve(options.problems, options.workers, options.budget, options.seed,
+                        iterations=options.iterations):
+        print(json.dumps(result), flush=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,203 @@
+"""Benchmark harness over TSP instances with known solutions (test_TSP directory).
+
+    Every instance is solved with several seeds in a process pool by a single drone without
+    capacity limit ('simple' metric, as City.test_tsp). Runs record cost, gap to the known
+    solution, iterations per second, wall time, time to get within given gaps and peak memory.
+    Summaries can be stored as a baseline and later runs compared against it:
+
+        python benchmark.py --seeds 4 --save-baseline baseline.json
+        python benchmark.py --seeds 4 --baseline baseline.json
+
+    The second command exits with status 1 when any instance regressed. Run it from the
+    repository root."""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import datetime
+import json
+import os
+from random import seed
+from statistics import mean
+import sys
+import time
+
+try:
+    import resource
+except ImportError: # Not available on Windows, memory peak is not recorded there.
+    resource = None
+
+from City import City
+from Drone import Drone
+from Observer import Observer
+
+SUITES = ('raw_test', 'coord_test')
+
+
+def instances(directory='test_TSP'):
+    """Names (suite/file) of all benchmark instances."""
+    return [suite + '/' + name for suite in SUITES
+            for name in sorted(os.listdir(os.path.join(directory, suite)))]
+
+
+def load(instance):
+    """City with a single drone without capacity limit for a benchmark instance."""
+    suite, name = instance.split('/')
+    city = City(metric='simple')
+    if suite == 'raw_test':
+        city.rload(os.path.join('test_TSP', suite, name))
+    else:
+        city.cload(os.path.join('test_TSP', suite, name))
+    city += Drone(1, base=city.position)
+    return city
+
+
+class Quality(Observer):
+    """Records seconds since start until cost first gets within given gaps (fractions) of the
+        known solution; None for gaps not reached."""
+
+    def __init__(self, gaps):
+        self.gaps = gaps
+        self.reached = {}
+        self.start = None
+
+    def on_start(self, city, **data):
+        self.start = time.perf_counter()
+        self.reached = {gap : None for gap in self.gaps}
+
+    def on_cost(self, city, **data):
+        self.check(city)
+
+    def on_improvement(self, city, **data):
+        self.check(city)
+
+    def check(self, city):
+        for gap in self.gaps:
+            if self.reached[gap] is None and city.total_cost <= city.solution * (1 + gap):
+                self.reached[gap] = time.perf_counter() - self.start
+
+
+def run(instance, run_seed, gaps, options):
+    """Solves an instance once, returns measurements of the run."""
+    seed(run_seed)
+    city = load(instance)
+    quality = Quality(gaps)
+    city.observers.append(quality)
+    start = time.perf_counter()
+    city.full_simulated_annealing(test=True, **options)
+    wall_time = time.perf_counter() - start
+    return {'instance' : instance,
+            'seed' : run_seed,
+            'cost' : city.total_cost,
+            'solution' : city.solution,
+            'gap' : city.total_cost / city.solution - 1,
+            'iterations' : city.iterations,
+            'wall_time' : wall_time,
+            'iterations_per_second' : city.iterations / wall_time,
+            'time_to' : {str(gap) : seconds for gap, seconds in quality.reached.items()},
+            # Kilobytes on Linux; every run has a fresh worker process (see benchmark).
+            'memory_peak' : (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                             if resource else None)}
+
+
+def benchmark(names=None, seeds=4, workers=None, gaps=(0.05, 0.1, 0.2), **options):
+    """Runs every instance (all by default) with seeds 0..seeds-1 in parallel.
+
+        Options are passed to City.full_simulated_annealing. Returns measurements of all runs."""
+    names = instances() if names is None else names
+    jobs = [(name, run_seed) for name in names for run_seed in range(seeds)]
+    pool = {'max_workers' : workers}
+    if sys.version_info >= (3, 11):
+        pool['max_tasks_per_child'] = 1 # Memory peaks of runs stay separate.
+    with ProcessPoolExecutor(**pool) as executor:
+        return list(executor.map(run, [name for name, _ in jobs],
+                                 [run_seed for _, run_seed in jobs],
+                                 [gaps] * len(jobs), [options] * len(jobs)))
+
+
+def summarize(results):
+    """Per instance means over seeds (maximum for memory peak); time to a gap is averaged over
+        runs which reached it, reached is their share."""
+    summary = {}
+    for name in dict.fromkeys(result['instance'] for result in results):
+        runs = [result for result in results if result['instance'] == name]
+        peaks = [result['memory_peak'] for result in runs if result['memory_peak'] is not None]
+        summary[name] = {'gap' : mean(result['gap'] for result in runs),
+                         'iterations_per_second' : mean(result['iterations_per_second']
+                                                        for result in runs),
+                         'wall_time' : mean(result['wall_time'] for result in runs),
+                         'memory_peak' : max(peaks) if peaks else None,
+                         'time_to' : {}, 'reached' : {}}
+        for gap in runs[0]['time_to']:
+            times = [result['time_to'][gap] for result in runs
+                     if result['time_to'][gap] is not None]
+            summary[name]['time_to'][gap] = mean(times) if times else None
+            summary[name]['reached'][gap] = len(times) / len(runs)
+    return summary
+
+
+def compare(summary, baseline, speed_threshold=0.1, quality_threshold=0.01):
+    """Regressions of a summary against a baseline summary: iterations per second lower by more
+        than speed_threshold (relative) or mean gap higher by more than quality_threshold."""
+    regressions = []
+    for name, current in summary.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]
+        if (current['iterations_per_second'] <
+                before['iterations_per_second'] * (1 - speed_threshold)):
+            regressions.append('{}: {:.0f} iterations/s, baseline {:.0f}'.format(
+                name, current['iterations_per_second'], before['iterations_per_second']))
+        if current['gap'] > before['gap'] + quality_threshold:
+            regressions.append('{}: gap {:.2%}, baseline {:.2%}'.format(
+                name, current['gap'], before['gap']))
+    return regressions
+
+
+def temperature(value):
+    """Temperature given on the command line: a number or 'auto' (see schedules.Schedule)."""
+    return value if value == 'auto' else float(value)
+
+
+def main(arguments=None):
+    """Command line interface, returns exit status."""
+    parser = argparse.ArgumentParser(description='Benchmarks simulated annealing on TSP instances.')
+    parser.add_argument('--instances', nargs='*', help='instance names, e.g. raw_test/a280.txt')
+    parser.add_argument('--seeds', type=int, default=4)
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--iterations', type=int, default=10_000)
+    parser.add_argument('--schedule', default='geometric')
+    parser.add_argument('--initial-temperature', type=temperature, default='auto')
+    parser.add_argument('--final-temperature', type=temperature, default='auto')
+    parser.add_argument('--gaps', type=float, nargs='*', default=[0.05, 0.1, 0.2])
+    parser.add_argument('--baseline', help='summary to compare with')
+    parser.add_argument('--save-baseline', help='where to store summary of this run')
+    parser.add_argument('--speed-threshold', type=float, default=0.1)
+    parser.add_argument('--quality-threshold', type=float, default=0.01)
+    options = parser.parse_args(arguments)
+    results = benchmark(options.instances, options.seeds, options.workers, tuple(options.gaps),
+                        iterations=options.iterations, schedule=options.schedule,
+                        initial_temperature=options.initial_temperature,
+                        final_temperature=options.final_temperature)
+    summary = summarize(results)
+    for name, row in summary.items():
+        print('{:30} gap {:7.2%} {:9.0f} it/s {:7.2f} s'.format(
+            name, row['gap'], row['iterations_per_second'], row['wall_time']))
+    result_file_name = datetime.datetime.now().strftime('%Y_%m_%d_%H_%M_%S.json')
+    with open(os.path.join('test_TSP', 'test_results', result_file_name), 'w') as result_file:
+        json.dump({'options' : vars(options), 'summary' : summary, 'results' : results},
+                  result_file, indent=4)
+    if options.save_baseline:
+        with open(options.save_baseline, 'w') as baseline_file:
+            json.dump(summary, baseline_file, indent=4)
+    if options.baseline:
+        with open(options.baseline) as baseline_file:
+            regressions = compare(summary, json.load(baseline_file), options.speed_threshold,
+                                  options.quality_threshold)
+        for regression in regressions:
+            print('Regression', regression)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,51 @@
+"""Compact binary format of problems and solutions (used by City.bstore and City.bload).
+
+    A file holds a magic string, the length of a JSON header (8 bytes, little endian), the
+    header (scalar parameters and a table of arrays: dtype, shape and offset) and contiguous
+    arrays aligned to 64 bytes. Arrays are written in one go and read back as read-only
+    memory maps, without parsing, so processes opening the same file share one copy of it."""
+
+import json
+
+import numpy as np
+
+MAGIC = b'DRONES01'
+ALIGNMENT = 64
+
+
+def write(path, meta, arrays):
+    """Writes scalar parameters (JSON-serializable dict) and named NumPy arrays."""
+    arrays = {name : np.ascontiguousarray(values) for name, values in arrays.items()}
+    table = {}
+    offset = 0
+    for name, values in arrays.items():
+        table[name] = [values.dtype.str, list(values.shape), offset]
+        offset += -(-values.nbytes // ALIGNMENT) * ALIGNMENT
+    header = json.dumps({'meta' : meta, 'arrays' : table}).encode()
+    start = -(-(len(MAGIC) + 8 + len(header)) // ALIGNMENT) * ALIGNMENT
+    with open(path, 'wb') as binary_file:
+        binary_file.write(MAGIC)
+        binary_file.write(len(header).to_bytes(8, 'little'))
+        binary_file.write(header)
+        for name, values in arrays.items():
+            binary_file.seek(start + table[name][2])
+            binary_file.write(values.tobytes())
+        binary_file.truncate(start + offset)
+
+
+def read(path):
+    """Opens a file written by write. Returns scalar parameters and read-only memory mapped
+        arrays."""
+    with open(path, 'rb') as binary_file:
+        if binary_file.read(len(MAGIC)) != MAGIC:
+            raise ValueError('Not a binary problem file: ' + str(path))
+        length = int.from_bytes(binary_file.read(8), 'little')
+        header = json.loads(binary_file.read(length))
+    start = -(-(len(MAGIC) + 8 + length) // ALIGNMENT) * ALIGNMENT
+    raw = np.memmap(path, np.uint8, 'r')
+    arrays = {}
+    for name, (dtype, shape, offset) in header['arrays'].items():
+        dtype = np.dtype(dtype)
+        size = dtype.itemsize * int(np.prod(shape))
+        arrays[name] = raw[start + offset:start + offset + size].view(dtype).reshape(shape)
+    return header['meta'], arrays
@@ -0,0 +1,145 @@
+"""Cluster-first, route-second solving of large instances.
+
+    Parcels are partitioned into spatial clusters (k-means or sweep sectors around the base),
+    every cluster is annealed by the whole fleet independently in a process pool and routes
+    of every drone are stitched cluster after cluster. Boundaries are then polished: pairs of
+    neighbouring clusters are annealed again together, warm-started from the stitched routes
+    (see initializers.keep), so that parcels can move between them:
+
+        stats = decomposition.solve(city, size=500, iterations=20_000)
+
+    Sub-problems are small, so neither their legs tables nor their search spaces grow with
+    the size of the whole instance."""
+
+from concurrent.futures import ProcessPoolExecutor
+from copy import copy
+from math import atan2, ceil
+from random import randrange, sample, seed
+import time
+
+import numpy as np
+
+from City import City
+
+
+def sweep(city, clusters):
+    """Sectors of (nearly) equal size of parcels sorted by polar angle around the base."""
+    parcels = sorted(city.parcels, key=lambda parcel: atan2(parcel.position.y - city.position.y,
+                                                            parcel.position.x - city.position.x))
+    size = ceil(len(parcels) / clusters)
+    return [parcels[start:start + size] for start in range(0, len(parcels), size)]
+
+
+def kmeans(city, clusters, rounds=20):
+    """Lloyd's k-means over parcel positions (centres start at random parcels). Clusters are
+        ordered by polar angle of their centres around the base, so consecutive ones are
+        neighbours; empty clusters are dropped."""
+    positions = np.array([parcel.position for parcel in city.parcels], np.float64).reshape(-1, 2)
+    centres = positions[sample(range(len(positions)), min(clusters, len(positions)))]
+    for _ in range(rounds):
+        labels = ((positions[:, np.newaxis] - centres) ** 2).sum(axis=2).argmin(axis=1)
+        moved = centres.copy()
+        for label in np.unique(labels):
+            moved[label] = positions[labels == label].mean(axis=0)
+        if np.array_equal(moved, centres):
+            break
+        centres = moved
+    parts = [[] for _ in centres]
+    for parcel, label in zip(city.parcels, labels.tolist()):
+        parts[label].append(parcel)
+    angles = np.arctan2(centres[:, 1] - city.position.y, centres[:, 0] - city.position.x)
+    return [parts[label] for label in np.argsort(angles).tolist() if parts[label]]
+
+
+PARTITIONS = {'sweep' : sweep,
+              'kmeans' : kmeans}
+
+
+def pack(city, parcels):
+    """Sub-problem of given parcels for the whole fleet (see City.pack), drones keep their
+        bases, winds and routes restricted to these parcels."""
+    part = City(position=city.position, wind=city.wind)
+    part.parcels = parcels
+    members = set(parcels)
+    for drone in city.drones:
+        part_drone = copy(drone)
+        part_drone.parcels = [parcel for parcel in drone.parcels if parcel in members]
+        part += part_drone
+    return part.pack()
+
+
+def run(problem, settings, part_seed, options):
+    """Anneals a sub-problem (in a worker process). Returns routes as parcel numbers (one list
+        per drone)."""
+    seed(part_seed)
+    city = City(**settings)
+    city.unpack(*problem)
+    city.full_simulated_annealing(test=True, **options)
+    return [[parcel.number for parcel in drone.parcels] for drone in city.drones]
+
+
+def splice(route, parcels, replacement):
+    """Route with given parcels (a set) replaced by a new sequence, put in place of the first
+        of them."""
+    first = next((k for k, parcel in enumerate(route) if parcel in parcels), len(route))
+    return route[:first] + replacement + [parcel for parcel in route[first:]
+                                          if parcel not in parcels]
+
+
+def rounds(count):
+    """Rounds of boundary passes: disjoint pairs of neighbouring clusters, so that every two
+        consecutive clusters around the base (the last and the first too) are paired once."""
+    if count < 3:
+        return [[(0, 1)]] if count == 2 else []
+    pairs = [(i, (i + 1) % count) for i in range(count)]
+    if count % 2:
+        return [pairs[0:-1:2], pairs[1::2], pairs[-1:]]
+    return [pairs[0::2], pairs[1::2]]
+
+
+def solve(city, clusters=None, size=500, method='kmeans', workers=None, polish=None,
+          **options):
+    """Solves a city by decomposition; routes are applied to the city. Returns statistics.
+
+        The number of clusters defaults to one per size parcels. Options are passed to
+        full_simulated_annealing of every cluster; polish holds options of boundary passes
+        (by default the same, but cooling from 0.01 to 0.001 not to undo the stitched
+        routes), polish=False skips them. Sub-problems are seeded from the global random
+        generator."""
+    start_time = time.perf_counter()
+    if clusters is None:
+        clusters = ceil(len(city.parcels) / size)
+    parts = PARTITIONS[method](city, max(1, clusters))
+    settings = {'metric' : city.metric, 'moves' : city.selector.names,
+                'initializer' : city.initializer}
+    if polish is None:
+        polish = dict(options, initial_temperature=0.01, final_temperature=0.001)
+    numbers = {parcel.number : parcel for parcel in city.parcels}
+    for drone in city.drones:
+        drone.parcels = []
+    stats = {'clusters' : [len(part) for part in parts]}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(run, [pack(city, part) for part in parts], [settings] * len(parts),
+                               [randrange(2 ** 32) for _ in parts], [options] * len(parts))
+        for routes in results:
+            for drone, route in zip(city.drones, routes):
+                drone.parcels.extend(numbers[number] for number in route)
+        city.calculate_cost()
+        stats['stitched_cost'] = city.total_cost
+        if polish is not False:
+            settings['initializer'] = 'keep'
+            for pairs in rounds(len(parts)):
+                joined = [parts[i] + parts[j] for i, j in pairs]
+                results = executor.map(run, [pack(city, pair) for pair in joined],
+                                       [settings] * len(joined),
+                                       [randrange(2 ** 32) for _ in joined],
+                                       [polish] * len(joined))
+                for pair, routes in zip(joined, results):
+                    members = set(pair)
+                    for drone, route in zip(city.drones, routes):
+                        drone.parcels = splice(drone.parcels, members,
+                                               [numbers[number] for number in route])
+            city.calculate_cost()
+    stats['cost'] = city.total_cost
+    stats['wall_time'] = time.perf_counter() - start_time
+    return stats
@@ -0,0 +1,110 @@
+"""Constructive initial solutions (warm starts) for simulated annealing.
+
+    Every initializer assigns all parcels of a city to its drones. They require legs and
+    neighbours of the city to be prepared (see City.prepare_algorithm)."""
+
+from math import atan2, ceil
+from random import choice
+
+
+def shuffled(city):
+    """Random assignment (see City.reassign_parcels)."""
+    city.reassign_parcels()
+
+
+def keep(city):
+    """Warm start: routes drones already have are kept (parcels no longer in the city are
+        dropped), parcels on no route are given to random drones (see shuffled)."""
+    free = set(city.parcels)
+    for drone in city.drones:
+        drone.parcels = [parcel for parcel in drone.parcels if parcel in free]
+        free.difference_update(drone.parcels)
+    for parcel in city.parcels:
+        if parcel in free:
+            choice(city.drones).parcels.append(parcel)
+
+
+def nearest(city):
+    """Nearest neighbour: drones take turns in extending their routes by the nearest parcel
+        not yet taken (looked up in candidate lists first, then among all parcels)."""
+    distances = city.legs.distances
+    free = set(city.parcels)
+    routes = [[] for _ in city.drones]
+    while free:
+        for route in routes:
+            if not free:
+                break
+            last = route[-1].index if route else 0
+            candidates = city.neighbours.candidates[last] if route else ()
+            parcel = next((candidate for candidate in candidates if candidate in free), None)
+            if parcel is None:
+                parcel = min(free, key=lambda parcel: distances[last][parcel.index])
+            free.remove(parcel)
+            route.append(parcel)
+    for drone, route in zip(city.drones, routes):
+        drone.parcels = route
+
+
+def sweep(city):
+    """Sweep: parcels sorted by polar angle around the base are cut into consecutive sectors
+        of (nearly) equal size, one per drone."""
+    parcels = sorted(city.parcels, key=lambda parcel: atan2(parcel.position.y - city.position.y,
+                                                            parcel.position.x - city.position.x))
+    size = ceil(len(parcels) / len(city.drones))
+    for number, drone in enumerate(city.drones):
+        drone.parcels = parcels[number * size:(number + 1) * size]
+
+
+def savings(city):
+    """Clarke-Wright savings: routes of single parcels are merged (by their ends) in order of
+        decreasing savings d(0, i) + d(0, j) - d(i, j) over nearest neighbour pairs, as long as
+        cargo fits every drone and routes are no longer than an equal share of parcels.
+        Resulting routes are given to drones with the least total length so far."""
+    distances = city.legs.distances
+    capacity = min(drone.max_capacity for drone in city.drones)
+    longest = ceil(len(city.parcels) / len(city.drones))
+    pairs = set()
+    for parcel in city.parcels:
+        for neighbour in city.neighbours.candidates[parcel.index]:
+            pairs.add((min(parcel.index, neighbour.index), max(parcel.index, neighbour.index)))
+    savings_list = sorted(((distances[0][i] + distances[0][j] - distances[i][j], i, j)
+                           for i, j in pairs), reverse=True)
+    route_of = {parcel.index : [parcel] for parcel in city.parcels}
+    weight_of = {id(route) : route[0].weight for route in route_of.values()}
+    for _, i, j in savings_list:
+        route1, route2 = route_of[i], route_of[j]
+        if route1 is route2 or len(route1) + len(route2) > longest:
+            continue
+        if weight_of[id(route1)] + weight_of[id(route2)] > capacity:
+            continue
+        if route1[-1].index != i:
+            if route1[0].index != i:
+                continue # Parcel i is inside of its route.
+            route1.reverse()
+        if route2[0].index != j:
+            if route2[-1].index != j:
+                continue
+            route2.reverse()
+        route1.extend(route2)
+        weight_of[id(route1)] += weight_of.pop(id(route2))
+        for parcel in route2:
+            route_of[parcel.index] = route1
+    routes = list({id(route) : route for route in route_of.values()}.values())
+    lengths = [distances[0][route[0].index] + distances[route[-1].index][0] +
+               sum(distances[parcel1.index][parcel2.index]
+                   for parcel1, parcel2 in zip(route[:-1], route[1:]))
+               for route in routes]
+    loads = [0] * len(city.drones)
+    for drone in city.drones:
+        drone.parcels = []
+    for length, route in sorted(zip(lengths, routes), key=lambda item: -item[0]):
+        number = min(range(len(loads)), key=loads.__getitem__)
+        city.drones[number].parcels.extend(route)
+        loads[number] += length
+
+
+INITIALIZERS = {'random' : shuffled,
+                'keep' : keep,
+                'nearest' : nearest,
+                'sweep' : sweep,
+                'savings' : savings}
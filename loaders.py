@@ -0,0 +1,35 @@
+"""Bulk parsing of parcel files (used by City.rload and City.cload).
+
+    Files start with the known solution, then every line holds a parcel number and two
+    coordinates. All lines are parsed by a single np.loadtxt call, no Python work is done per
+    line."""
+
+import os
+
+import numpy as np
+
+EARTH_RADIUS = 6371000
+
+
+def resolve(file_name, directory):
+    """Path of a file to read: the name as given if such a file exists (relative to the working
+        directory), otherwise the file of that name in a default directory."""
+    return file_name if os.path.exists(file_name) else os.path.join(directory, file_name)
+
+
+def read(path):
+    """Reads a parcel file. Returns the known solution, parcel numbers and both coordinate
+        columns as arrays."""
+    with open(path) as points_file:
+        solution = int(points_file.readline())
+        table = np.loadtxt(points_file, ndmin=2)
+    return solution, table[:, 0].astype(np.int64), table[:, 1], table[:, 2]
+
+
+def project(latitudes, longitudes):
+    """Converts GPS coordinates to xy (metres, rounded) by equirectangular projection around
+        the mean latitude."""
+    th0 = np.radians(latitudes.mean())
+    xs = np.rint(EARTH_RADIUS * np.radians(longitudes) * np.cos(th0))
+    ys = np.rint(EARTH_RADIUS * np.radians(latitudes))
+    return xs.astype(np.int64), ys.astype(np.int64)
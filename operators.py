@@ -0,0 +1,386 @@
+"""Neighbourhood operators (moves) for simulated annealing.
+
+    Every operator modifies drones of a city in place and returns a tuple (affected, undo, deltas):
+    indices of affected drones, an undo record for undo() and cost deltas of affected drones
+    (parallel to affected) or None when they have to be recalculated. Deltas are exact only for
+    the 'simple' metric and drones without capacity limit (their route is a single trip)."""
+
+from math import inf
+from random import choice, choices, randint, random, randrange
+
+NOTHING = ((), None, [])
+
+
+def node(parcels, k):
+    """Parcel at position k of a route, None (base) outside of it."""
+    return parcels[k] if 0 <= k < len(parcels) else None
+
+
+def span(drone, first, last):
+    """Length of edges first..last of a single trip route (edge k ends at position k)."""
+    parcels = drone.parcels
+    return sum(drone.distance(node(parcels, k - 1), node(parcels, k))
+               for k in range(first, last + 1))
+
+
+def exact(city, *indices):
+    """Whether deltas can be evaluated locally for given drones."""
+    return city.metric == 'simple' and all(city.drones[index].max_capacity == inf
+                                           for index in indices)
+
+
+def twoopt(city):
+    """Reverses a random segment of a random drone's route."""
+    index = randrange(len(city.drones))
+    drone = city.drones[index]
+    if len(drone.parcels) < 2:
+        return NOTHING
+    i = randrange(len(drone.parcels) - 1)
+    k = randrange(i + 2, len(drone.parcels) + 1)
+    return apply_twoopt(city, index, i, k)
+
+
+def apply_twoopt(city, index, i, k):
+    """Reverses parcels[i:k] of a given drone."""
+    drone = city.drones[index]
+    if not exact(city, index):
+        drone.reverse(i, k)
+        return (index,), ('twoopt', index, i, k), None
+    before = span(drone, i, k)
+    drone.reverse(i, k)
+    return (index,), ('twoopt', index, i, k), [span(drone, i, k) - before]
+
+
+def reinsert(city):
+    """Moves a random parcel between two random drones."""
+    return relocate(city, 1, False)
+
+
+def oropt(city):
+    """Moves a random segment of up to three parcels (possibly reversed) to a random place."""
+    return relocate(city, 3, random() < 0.5)
+
+
+def relocate(city, longest, reverse):
+    """Moves a random segment of up to longest parcels between two random drones."""
+    from_index = randrange(len(city.drones))
+    from_drone = city.drones[from_index]
+    if not from_drone.parcels:
+        return NOTHING
+    to_index = randrange(len(city.drones))
+    to_drone = city.drones[to_index]
+    length = randint(1, min(longest, len(from_drone.parcels)))
+    i = randrange(len(from_drone.parcels) - length + 1)
+    j = randint(0, len(to_drone.parcels) - (length if from_index == to_index else 0))
+    return apply_relocate(city, from_index, i, length, to_index, j, reverse)
+
+
+def apply_relocate(city, from_index, i, length, to_index, j, reverse):
+    """Moves parcels[i:i + length] of drone from_index to position j (counted after removal)
+        of drone to_index."""
+    from_drone = city.drones[from_index]
+    to_drone = city.drones[to_index]
+    deltas = [0, 0] if exact(city, from_index, to_index) else None
+    if deltas:
+        deltas[0] -= span(from_drone, i, i + length)
+    segment = from_drone.parcels[i:i + length]
+    del from_drone.parcels[i:i + length]
+    if deltas:
+        deltas[0] += span(from_drone, i, i)
+    if reverse:
+        segment.reverse()
+    if deltas:
+        deltas[1] -= span(to_drone, j, j)
+    to_drone.parcels[j:j] = segment
+    track(city, to_drone, j, j + length)
+    if deltas:
+        deltas[1] += span(to_drone, j, j + length)
+    return ((from_index, to_index), ('relocate', from_index, i, length, to_index, j, reverse),
+            deltas)
+
+
+def swap(city):
+    """Exchanges two random parcels (within a drone or between two drones)."""
+    index1 = randrange(len(city.drones))
+    index2 = randrange(len(city.drones))
+    drone1 = city.drones[index1]
+    drone2 = city.drones[index2]
+    if not drone1.parcels or not drone2.parcels:
+        return NOTHING
+    p = randrange(len(drone1.parcels))
+    q = randrange(len(drone2.parcels))
+    if index1 == index2:
+        p, q = sorted([p, q])
+        if p == q:
+            return NOTHING
+    undo = ('swap', index1, p, index2, q)
+    if not exact(city, index1, index2):
+        exchange(city, index1, p, index2, q)
+        return (index1, index2), undo, None
+    if index1 == index2:
+        windows = [(p, q + 1)] if q == p + 1 else [(p, p + 1), (q, q + 1)]
+        before = sum(span(drone1, first, last) for first, last in windows)
+        exchange(city, index1, p, index2, q)
+        return (index1,), undo, [sum(span(drone1, first, last) for first, last in windows) - before]
+    before1, before2 = span(drone1, p, p + 1), span(drone2, q, q + 1)
+    exchange(city, index1, p, index2, q)
+    return (index1, index2), undo, [span(drone1, p, p + 1) - before1,
+                                    span(drone2, q, q + 1) - before2]
+
+
+def exchange(city, index1, p, index2, q):
+    """Exchanges parcels at position p of drone index1 and position q of drone index2."""
+    parcels1 = city.drones[index1].parcels
+    parcels2 = city.drones[index2].parcels
+    parcels1[p], parcels2[q] = parcels2[q], parcels1[p]
+    track(city, city.drones[index1], p, p + 1)
+    track(city, city.drones[index2], q, q + 1)
+
+
+def twooptstar(city):
+    """Exchanges tails of routes of two different random drones (2-opt*)."""
+    if len(city.drones) < 2:
+        return NOTHING
+    index1, index2 = sample_two(len(city.drones))
+    drone1 = city.drones[index1]
+    drone2 = city.drones[index2]
+    i = randint(0, len(drone1.parcels))
+    j = randint(0, len(drone2.parcels))
+    return apply_twooptstar(city, index1, i, index2, j)
+
+
+def apply_twooptstar(city, index1, i, index2, j):
+    """Exchanges parcels[i:] of drone index1 with parcels[j:] of drone index2."""
+    drone1 = city.drones[index1]
+    drone2 = city.drones[index2]
+    undo = ('twooptstar', index1, i, index2, j)
+    if not exact(city, index1, index2):
+        exchange_tails(city, index1, i, index2, j)
+        return (index1, index2), undo, None
+    before1 = span(drone1, i, len(drone1.parcels))
+    before2 = span(drone2, j, len(drone2.parcels))
+    exchange_tails(city, index1, i, index2, j)
+    return (index1, index2), undo, [span(drone1, i, len(drone1.parcels)) - before1,
+                                    span(drone2, j, len(drone2.parcels)) - before2]
+
+
+def exchange_tails(city, index1, i, index2, j):
+    """Exchanges parcels[i:] of drone index1 with parcels[j:] of drone index2."""
+    drone1 = city.drones[index1]
+    drone2 = city.drones[index2]
+    drone1.parcels[i:], drone2.parcels[j:] = drone2.parcels[j:], drone1.parcels[i:]
+    track(city, drone1, i, len(drone1.parcels))
+    track(city, drone2, j, len(drone2.parcels))
+
+
+def cross(city):
+    """Exchanges segments of up to three parcels between two different random drones."""
+    if len(city.drones) < 2:
+        return NOTHING
+    index1, index2 = sample_two(len(city.drones))
+    drone1 = city.drones[index1]
+    drone2 = city.drones[index2]
+    if not drone1.parcels or not drone2.parcels:
+        return NOTHING
+    s = randint(1, min(3, len(drone1.parcels)))
+    t = randint(1, min(3, len(drone2.parcels)))
+    i = randrange(len(drone1.parcels) - s + 1)
+    j = randrange(len(drone2.parcels) - t + 1)
+    undo = ('cross', index1, i, t, index2, j, s)
+    if not exact(city, index1, index2):
+        exchange_segments(city, index1, i, s, index2, j, t)
+        return (index1, index2), undo, None
+    before1, before2 = span(drone1, i, i + s), span(drone2, j, j + t)
+    exchange_segments(city, index1, i, s, index2, j, t)
+    return (index1, index2), undo, [span(drone1, i, i + t) - before1,
+                                    span(drone2, j, j + s) - before2]
+
+
+def exchange_segments(city, index1, i, s, index2, j, t):
+    """Exchanges parcels[i:i + s] of drone index1 with parcels[j:j + t] of drone index2."""
+    parcels1 = city.drones[index1].parcels
+    parcels2 = city.drones[index2].parcels
+    parcels1[i:i + s], parcels2[j:j + t] = parcels2[j:j + t], parcels1[i:i + s]
+    track(city, city.drones[index1], i, i + t)
+    track(city, city.drones[index2], j, j + s)
+
+
+def nearinsert(city):
+    """Moves a random parcel next to one of its nearest neighbours (see Neighbours)."""
+    if city.neighbours is None:
+        return reinsert(city)
+    from_index = randrange(len(city.drones))
+    from_drone = city.drones[from_index]
+    if not from_drone.parcels:
+        return NOTHING
+    i = randrange(len(from_drone.parcels))
+    candidates = city.neighbours.candidates[from_drone.parcels[i].index]
+    if not candidates:
+        return NOTHING
+    located = locate(city, choice(candidates))
+    if located is None:
+        return NOTHING
+    to_index, j = located
+    if from_index == to_index:
+        if abs(i - j) == 1:
+            return NOTHING
+        j -= j > i
+    return apply_relocate(city, from_index, i, 1, to_index, j + (random() < 0.5), False)
+
+
+def neartwoopt(city):
+    """Makes a random parcel adjacent to one of its nearest neighbours by reversing a segment
+        (same drone) or exchanging route tails (2-opt* with another drone)."""
+    if city.neighbours is None:
+        return twoopt(city)
+    index1 = randrange(len(city.drones))
+    parcels = city.drones[index1].parcels
+    if not parcels:
+        return NOTHING
+    i = randrange(len(parcels))
+    candidates = city.neighbours.candidates[parcels[i].index]
+    if not candidates:
+        return NOTHING
+    located = locate(city, choice(candidates))
+    if located is None:
+        return NOTHING
+    index2, j = located
+    if index1 != index2:
+        return apply_twooptstar(city, index1, i + 1, index2, j)
+    if abs(i - j) == 1:
+        return NOTHING
+    if j > i:
+        return apply_twoopt(city, index1, i + 1, j + 1)
+    return apply_twoopt(city, index1, j, i)
+
+
+def locate(city, parcel):
+    """Index of the drone carrying a parcel and the parcel's position in its route, None if
+        no drone of the city carries it (see City.local_annealing).
+
+        The parcel is looked up in city.placement (see track); positions there are hints,
+        moves within a route leave them behind and they are repaired here by searching that
+        route only. Drones are scanned only when the placement is missing or stale."""
+    try:
+        drone, position = city.placement[parcel.index]
+    except (IndexError, TypeError):
+        return scan(city, parcel)
+    parcels = drone.parcels
+    if position >= len(parcels) or parcels[position] is not parcel:
+        try:
+            position = parcels.index(parcel)
+        except ValueError:
+            return scan(city, parcel)
+        city.placement[parcel.index] = (drone, position)
+    try:
+        return city.drones.index(drone), position
+    except ValueError:
+        return None # Carried by a drone outside of the city's (restricted) drones.
+
+
+def scan(city, parcel):
+    """Locates a parcel by searching routes of all drones (see locate)."""
+    for index, drone in enumerate(city.drones):
+        try:
+            return index, drone.parcels.index(parcel)
+        except ValueError:
+            continue
+    return None
+
+
+def track(city, drone, start, stop):
+    """Records drone and position of parcels drone.parcels[start:stop] in city.placement (by
+        parcel index). Moves call it whenever parcels change drones."""
+    placement = city.placement
+    parcels = drone.parcels
+    for position in range(start, min(stop, len(parcels))):
+        index = parcels[position].index
+        if index < len(placement):
+            placement[index] = (drone, position)
+
+
+def sample_two(count):
+    """Two different random indices below count."""
+    first = randrange(count)
+    second = randrange(count - 1)
+    return first, second + (second >= first)
+
+
+def undo(city, record):
+    """Undoes a move given its undo record."""
+    if record is None:
+        return
+    name = record[0]
+    if name == 'twoopt':
+        _, index, i, k = record
+        city.drones[index].reverse(i, k)
+    elif name == 'relocate':
+        _, from_index, i, length, to_index, j, reverse = record
+        to_parcels = city.drones[to_index].parcels
+        segment = to_parcels[j:j + length]
+        del to_parcels[j:j + length]
+        if reverse:
+            segment.reverse()
+        city.drones[from_index].parcels[i:i] = segment
+        track(city, city.drones[from_index], i, i + length)
+    elif name == 'swap':
+        exchange(city, *record[1:])
+    elif name == 'twooptstar':
+        exchange_tails(city, *record[1:])
+    elif name == 'cross':
+        exchange_segments(city, *record[1:])
+
+
+def redo(city, record):
+    """Applies an undone move again given its undo record (see City.iteration)."""
+    if record is None:
+        return
+    name = record[0]
+    if name == 'relocate':
+        _, from_index, i, length, to_index, j, reverse = record
+        from_parcels = city.drones[from_index].parcels
+        segment = from_parcels[i:i + length]
+        del from_parcels[i:i + length]
+        if reverse:
+            segment.reverse()
+        city.drones[to_index].parcels[j:j] = segment
+        track(city, city.drones[to_index], j, j + length)
+    elif name == 'cross':
+        _, index1, i, t, index2, j, s = record
+        exchange_segments(city, index1, i, s, index2, j, t)
+    else:
+        undo(city, record) # Other moves are their own inverses.
+
+
+OPERATORS = {'twoopt' : twoopt,
+             'reinsert' : reinsert,
+             'oropt' : oropt,
+             'swap' : swap,
+             'twooptstar' : twooptstar,
+             'cross' : cross,
+             'nearinsert' : nearinsert,
+             'neartwoopt' : neartwoopt}
+
+
+class Selector(object):
+    """Adaptive operator selection: roulette wheel weighted by recent acceptance.
+
+        After every use an operator's weight moves towards 1 if the move was accepted and
+        towards 0 otherwise (exponential smoothing with given reaction); floor keeps every
+        operator in play."""
+
+    def __init__(self, names=tuple(OPERATORS), reaction=0.01, floor=0.05):
+        self.names = list(names)
+        self.operators = [OPERATORS[name] for name in self.names]
+        self.weights = [1.0] * len(self.names)
+        self.reaction = reaction
+        self.floor = floor
+
+    def choose(self):
+        """Index of a randomly chosen operator."""
+        return choices(range(len(self.weights)), self.weights)[0]
+
+    def update(self, index, accepted):
+        """Rewards an operator according to the outcome of its move."""
+        weight = (1 - self.reaction) * self.weights[index] + self.reaction * accepted
+        self.weights[index] = max(self.floor, weight)
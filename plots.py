@@ -38,13 +38,13 @@ def show_drone_paths(city, final=False, test=False, show_solution=True):
     plt.pause(0.05)
 
 def show_distance_history(city, test=False):
-    """Plots consecutive iterations of an angorithm."""
+    """Plots consecutive iterations of an angorithm (as sampled by city.recorder)."""
     if test:
         return
     plt.ioff()
     plt.clf()
-    for key, value in city.total_costs.items():
-        plt.plot(value, label=str(key), alpha=0.7)
+    for key, value in city.recorder.history.items():
+        plt.plot(city.recorder.iterations, value, label=str(key), alpha=0.7)
     plt.legend()
     plt.show()
 
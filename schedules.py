@@ -0,0 +1,199 @@
+"""Cooling schedules and stopping criteria for simulated annealing.
+
+    City.full_simulated_annealing starts a schedule (and every stopping criterion) once the
+    algorithm is prepared, runs iterations at schedule.temperature and calls schedule.update
+    after each of them, until the schedule is finished or any criterion fires. Temperatures
+    are relative to City.scale (see City.iteration)."""
+
+from abc import ABC, abstractmethod
+from math import inf, log
+from statistics import mean
+import time
+
+
+def calibrate(city, samples=200):
+    """Mean cost increase of uphill moves among random moves, each undone right away.
+        Zero if none of the moves went uphill."""
+    uphill = []
+    for _ in range(samples):
+        previous_distance = city.total_cost
+        affected, undo, deltas = city.selector.operators[city.selector.choose()](city)
+        previous_costs = [(index, city.costs[index]) for index in affected]
+        city.update_cost(affected, deltas)
+        if city.total_cost > previous_distance:
+            uphill.append(city.total_cost - previous_distance)
+        city.revert(undo, previous_costs, previous_distance)
+    return mean(uphill) if uphill else 0
+
+
+class Schedule(ABC):
+    """Base schedule: cools from initial to final temperature within given iterations.
+
+        initial_temperature='auto' is calibrated on start so that an average uphill move is
+        accepted with given acceptance probability; final_temperature='auto' keeps the default
+        ratio (1:10000) to the initial one."""
+
+    def __init__(self, initial_temperature=10, final_temperature=0.001, iterations=10_000,
+                 acceptance=0.8):
+        self.initial_temperature = initial_temperature
+        self.final_temperature = final_temperature
+        self.iterations = iterations
+        self.acceptance = acceptance
+        self.initial = self.final = self.temperature = None
+        self.count = 0
+
+    def start(self, city):
+        """Resolves temperatures for a prepared city and resets the schedule."""
+        self.initial = self.initial_temperature
+        if self.initial == 'auto':
+            uphill = calibrate(city)
+            self.initial = -uphill / (city.scale * log(self.acceptance)) if uphill else 10
+        self.final = self.final_temperature
+        if self.final == 'auto':
+            self.final = self.initial / 10_000
+        self.temperature = self.initial
+        self.count = 0
+        self.prepare()
+
+    def prepare(self):
+        """Precomputes schedule parameters once temperatures are known."""
+
+    @property
+    def finished(self):
+        return self.temperature <= self.final
+
+    def update(self, accepted, improved):
+        """Moves temperature after an iteration given whether its move was accepted and
+            whether it found a new best solution."""
+        self.count += 1
+        self.cool(accepted, improved)
+
+    @abstractmethod
+    def cool(self, accepted, improved):
+        """Moves temperature after an iteration (see update)."""
+
+
+class Geometric(Schedule):
+    """Temperature multiplied by a constant rate every iteration (the classic schedule)."""
+
+    def prepare(self):
+        self.rate = pow(self.final / self.initial, 1 / self.iterations)
+
+    def cool(self, accepted, improved):
+        self.temperature *= self.rate
+
+
+class LundyMees(Schedule):
+    """Lundy-Mees schedule: T <- T / (1 + beta T), fast at high and slow at low temperatures."""
+
+    def prepare(self):
+        self.beta = (self.initial - self.final) / (self.iterations * self.initial * self.final)
+
+    def cool(self, accepted, improved):
+        self.temperature /= 1 + self.beta * self.temperature
+
+
+class Reheating(Geometric):
+    """Geometric schedule which multiplies temperature by factor (up to the initial one)
+        whenever no new best solution was found for patience iterations, at most limit times."""
+
+    def __init__(self, initial_temperature=10, final_temperature=0.001, iterations=10_000,
+                 acceptance=0.8, patience=1000, factor=10, limit=5):
+        super().__init__(initial_temperature, final_temperature, iterations, acceptance)
+        self.patience = patience
+        self.factor = factor
+        self.limit = limit
+
+    def prepare(self):
+        super().prepare()
+        self.reheats = 0
+        self.stagnation = 0
+
+    def cool(self, accepted, improved):
+        self.temperature *= self.rate
+        self.stagnation = 0 if improved else self.stagnation + 1
+        if self.stagnation >= self.patience and self.reheats < self.limit:
+            self.temperature = min(self.initial, self.temperature * self.factor)
+            self.reheats += 1
+            self.stagnation = 0
+
+
+class AcceptanceTarget(Schedule):
+    """Adjusts temperature every window iterations so that the share of accepted moves follows
+        a target falling geometrically from first to last rate; finishes after iterations."""
+
+    def __init__(self, initial_temperature=10, final_temperature=0.001, iterations=10_000,
+                 acceptance=0.8, first=0.5, last=0.01, window=100, step=1.2):
+        super().__init__(initial_temperature, final_temperature, iterations, acceptance)
+        self.first = first
+        self.last = last
+        self.window = window
+        self.step = step
+
+    def prepare(self):
+        self.accepted = 0
+
+    @property
+    def finished(self):
+        return self.count >= self.iterations
+
+    def cool(self, accepted, improved):
+        self.accepted += accepted
+        if self.count % self.window:
+            return
+        target = self.first * (self.last / self.first) ** (self.count / self.iterations)
+        if self.accepted < target * self.window:
+            self.temperature *= self.step
+        else:
+            self.temperature /= self.step
+        self.accepted = 0
+
+
+SCHEDULES = {'geometric' : Geometric,
+             'lundy-mees' : LundyMees,
+             'reheating' : Reheating,
+             'acceptance' : AcceptanceTarget}
+
+
+class WallClock(object):
+    """Stops once given number of seconds has passed since start."""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def start(self, city):
+        self.deadline = time.perf_counter() + self.seconds
+
+    def __call__(self, city):
+        return time.perf_counter() >= self.deadline
+
+
+class NoImprovement(object):
+    """Stops after given number of iterations without a new best cost (of this run, best
+        costs of earlier runs on the city are ignored)."""
+
+    def __init__(self, iterations):
+        self.iterations = iterations
+
+    def start(self, city):
+        self.best = inf
+        self.since = city.iterations
+
+    def __call__(self, city):
+        if city.total_cost < self.best:
+            self.best = city.total_cost
+            self.since = city.iterations
+        return city.iterations - self.since >= self.iterations
+
+
+class TargetCost(object):
+    """Stops once current cost is at most a target."""
+
+    def __init__(self, cost):
+        self.cost = cost
+
+    def start(self, city):
+        pass
+
+    def __call__(self, city):
+        return city.total_cost <= self.cost
@@ -0,0 +1,45 @@
+"""Shares NumPy arrays between processes in multiprocessing.shared_memory blocks (used by
+    City.share and City.attach).
+
+    The owner publishes arrays once and passes small picklable descriptors to other processes,
+    which map the same memory without copying. Blocks must stay referenced while their arrays
+    are in use; the owner unlinks them once everybody is done (see release)."""
+
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+def publish(arrays):
+    """Copies named arrays to new shared memory blocks. Returns descriptors (name of block,
+        dtype and shape of each array) and the blocks."""
+    descriptors = {}
+    blocks = []
+    for name, values in arrays.items():
+        values = np.ascontiguousarray(values)
+        block = shared_memory.SharedMemory(create=True, size=max(1, values.nbytes))
+        np.ndarray(values.shape, values.dtype, block.buf)[...] = values
+        descriptors[name] = (block.name, values.dtype.str, values.shape)
+        blocks.append(block)
+    return descriptors, blocks
+
+
+def attach(descriptors):
+    """Maps arrays published elsewhere. Returns read-only arrays and their blocks."""
+    arrays = {}
+    blocks = []
+    for name, (block_name, dtype, shape) in descriptors.items():
+        block = shared_memory.SharedMemory(block_name)
+        values = np.ndarray(shape, dtype, block.buf)
+        values.flags.writeable = False
+        arrays[name] = values
+        blocks.append(block)
+    return arrays, blocks
+
+
+def release(blocks, unlink=False):
+    """Closes blocks, the owner also unlinks (frees) them."""
+    for block in blocks:
+        block.close()
+        if unlink:
+            block.unlink()
@@ -0,0 +1,65 @@
+"""Batch module tests."""
+
+
+import json
+import os
+import tempfile
+import time
+import unittest
+
+import batch
+from City import City
+from common import Position as Pos
+from Drone import Drone
+from Parcel import Parcel
+
+
+class TestBatch(unittest.TestCase):
+    """Class provides tests for batch solving."""
+
+
+    def setUp(self):
+        """Prepare environment for testing."""
+
+        self.problems = []
+        for size in [5, 10, 15]:
+            city = City(position=Pos(0, 0))
+            city += [Drone(1, max_capacity=50, max_speed=10), Drone(2, max_capacity=50)]
+            city += [Parcel(n, Pos(10 * (n % 4), 10 * (n // 4)), 3) for n in range(1, size + 1)]
+            self.problems.append(city.dump())
+
+
+    def test_solve(self):
+        """Check that every problem gets its result and a broken one only reports an error."""
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'problem.json')
+            with open(path, 'w') as json_file:
+                json.dump(self.problems[0], json_file)
+            problems = self.problems + [path, {'wind' : [0, 0]}]
+
+            results = list(batch.solve(problems, workers=2, base_seed=0, iterations=200))
+
+        self.assertEqual(sorted(result['index'] for result in results), list(range(5)))
+        results.sort(key=lambda result: result['index'])
+        for problem, result in zip(problems, results[:4]):
+            if isinstance(problem, str):
+                problem = self.problems[0]
+            delivered = sorted(number for route in result['routes'].values() for number in route)
+            self.assertEqual(delivered, [parcel['number'] for parcel in problem['parcels']])
+        self.assertEqual(results[3]['problem'], path)
+        self.assertIn('error', results[4])
+
+
+    def test_budget(self):
+        """Check that a time budget stops long runs."""
+
+        start = time.perf_counter()
+        results = list(batch.solve(self.problems[:2], workers=2, budget=0.2, iterations=10 ** 9))
+
+        self.assertLess(time.perf_counter() - start, 10)
+        self.assertTrue(all(result['wall_time'] < 2 for result in results))
+
+
+if __name__ == '__main__':
+    unittest.main()
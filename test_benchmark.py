@@ -0,0 +1,55 @@
+"""Benchmark module tests."""
+
+
+import unittest
+
+import benchmark
+
+
+class TestBenchmark(unittest.TestCase):
+    """Class provides tests for benchmark harness functions."""
+
+
+    def test_instances(self):
+        """Check that instances of both suites are found and loaded."""
+
+        names = benchmark.instances()
+
+        self.assertIn('raw_test/berlin52.txt', names)
+        self.assertIn('coord_test/ulysses22.txt', names)
+        city = benchmark.load('raw_test/berlin52.txt')
+        self.assertEqual(len(city.parcels), 52)
+        self.assertEqual(city.solution, 7542)
+
+
+    def test_benchmark(self):
+        """Check measurements of parallel runs and their summary."""
+
+        results = benchmark.benchmark(['raw_test/dan20circle.txt'], seeds=2, workers=2,
+                                      gaps=(0.5, 10), iterations=300)
+
+        self.assertEqual([result['seed'] for result in results], [0, 1])
+        for result in results:
+            self.assertGreater(result['iterations_per_second'], 0)
+            self.assertGreater(result['gap'], -0.01) # Known solutions are rounded.
+            self.assertIsNotNone(result['time_to']['10'])
+        summary = benchmark.summarize(results)
+        self.assertEqual(list(summary), ['raw_test/dan20circle.txt'])
+        self.assertEqual(summary['raw_test/dan20circle.txt']['reached']['10'], 1)
+
+
+    def test_compare(self):
+        """Check that slower or worse runs are reported as regressions."""
+
+        baseline = {'a' : {'iterations_per_second' : 1000, 'gap' : 0.1}}
+
+        self.assertEqual(benchmark.compare({'a' : {'iterations_per_second' : 950, 'gap' : 0.105}},
+                                           baseline), [])
+        self.assertEqual(len(benchmark.compare({'a' : {'iterations_per_second' : 800, 'gap' : 0.2}},
+                                               baseline)), 2)
+        self.assertEqual(benchmark.compare({'b' : {'iterations_per_second' : 1, 'gap' : 1}},
+                                           baseline), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
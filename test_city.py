@@ -2,12 +2,26 @@
 # TODO tests are not up to date, they might pass, but prove nothing.
 
 
+import json
+import os
+import pickle
+import tempfile
+import threading
 import unittest
+from math import cos, inf, radians
+from random import choice, seed
 
+import numpy as np
+
+import binary
 from City import City
 from common import Position as Pos
 from Drone import Drone
+from Legs import Legs
 from Parcel import Parcel
+import initializers
+import operators
+import shared
 
 
 class TestCity(unittest.TestCase):
@@ -28,6 +42,8 @@ class TestCity(unittest.TestCase):
         self.drone1 += self.parcel1
         self.drone1 += self.parcel2
 
+        self.parcels = [Parcel(n, Pos(n % 7, n // 7), 3) for n in range(3, 30)] # Grid 7 wide
+
 
     def test___add__(self):
         """Check adding single drones and single parcels to the city."""
@@ -70,6 +86,22 @@ class TestCity(unittest.TestCase):
         self.assertEqual((sum(len(drone.parcels) for drone in self.city.drones)), 2)
 
 
+    def test_initializers(self):
+        """Checks that every initializer assigns each parcel exactly once."""
+
+        self.city += [self.drone0, self.drone1, Drone(2, max_capacity=50)]
+        self.city += [Parcel(n, Pos(n % 7 - 3, n // 7 - 2), 3) for n in range(3, 30)]
+        for initializer in initializers.INITIALIZERS:
+            self.city.initializer = initializer
+            self.city.prepare_algorithm()
+
+            assigned = sorted(parcel.number for drone in self.city.drones
+                              for parcel in drone.parcels)
+            self.assertEqual(assigned, list(range(3, 30)), initializer)
+            self.assertAlmostEqual(self.city.total_cost,
+                                   sum(drone.path_length for drone in self.city.drones))
+
+
     def test_calculate_cost(self):
         """Checks cost recalculation for a single drone with a single parcel."""
 
@@ -82,5 +114,504 @@ class TestCity(unittest.TestCase):
         self.assertEqual(self.city.total_cost, 2.8284271247461903)
 
 
+    def test_update_cost(self):
+        """Checks that incrementally updated costs match a full recalculation."""
+
+        self.city += [self.drone0, self.drone1]
+        self.city += self.parcels
+        self.city.prepare_algorithm()
+
+        for _ in range(200):
+            self.city.iteration(1)
+
+        cached_costs = list(self.city.costs)
+        cached_total_cost = self.city.total_cost
+        self.city.calculate_cost()
+
+        for cached_cost, cost in zip(cached_costs, self.city.costs):
+            self.assertAlmostEqual(cached_cost, cost)
+        self.assertAlmostEqual(cached_total_cost, self.city.total_cost)
+
+
+    def test_best(self):
+        """Checks that the best solution, snapshot lazily, holds routes of the best cost seen."""
+
+        seed(0)
+        self.city += [self.drone0, self.drone1]
+        self.city += self.parcels
+        self.city.prepare_algorithm()
+        best = (self.city.total_cost, [list(drone.parcels) for drone in self.city.drones])
+
+        for iteration in range(2000):
+            self.city.iteration(0.1 if iteration % 400 < 200 else 0.001)
+            if self.city.total_cost < best[0]:
+                best = (self.city.total_cost, [list(drone.parcels) for drone in self.city.drones])
+
+        current = [list(drone.parcels) for drone in self.city.drones]
+        cost, routes = self.city.best()
+        self.assertEqual([drone.parcels for drone in self.city.drones], current)
+        self.assertEqual(cost, best[0])
+        self.city.set_routes(routes)
+        self.assertEqual([drone.parcels for drone in self.city.drones], best[1])
+        self.assertAlmostEqual(self.city.total_cost, cost)
+
+
+    def test_best_concurrent(self):
+        """Checks that another thread reads only whole, consistent snapshots, even in the middle
+            of moves."""
+
+        self.city += [self.drone0, self.drone1]
+        self.city += self.parcels
+        self.city.prepare_algorithm()
+        snapshots = []
+        moved = threading.Event()
+        read = threading.Event()
+        done = threading.Event()
+
+        def interleaved(operator):
+            def move(city):
+                result = operator(city)
+                moved.set() # The reader runs while the move is neither accepted nor rejected.
+                read.wait()
+                read.clear()
+                return result
+            return move
+
+        def reader():
+            while True:
+                moved.wait()
+                moved.clear()
+                if done.is_set():
+                    return
+                snapshots.append(self.city.best())
+                read.set()
+
+        selector = self.city.selector
+        selector.operators = [interleaved(operator) for operator in selector.operators]
+        thread = threading.Thread(target=reader)
+        thread.start()
+        try:
+            for _ in range(2000):
+                self.city.iteration(0.01)
+        finally:
+            done.set()
+            moved.set()
+            thread.join()
+
+        self.assertEqual(len(snapshots), 2000)
+        for cost, routes in {id(snapshot) : snapshot for snapshot in snapshots}.values():
+            self.assertEqual(sorted(routes[0]), list(range(1, len(self.city.parcels) + 1)))
+            self.city.set_routes(routes)
+            self.assertAlmostEqual(self.city.total_cost, cost)
+
+
+    def test_revert(self):
+        """Checks that rejected moves restore the exact previous state without copying parcels."""
+
+        self.city += [self.drone0, self.drone1]
+        self.city += self.parcels
+        self.city.prepare_algorithm()
+
+        for _ in range(200):
+            routes = [list(drone.parcels) for drone in self.city.drones]
+            costs = list(self.city.costs)
+            total_cost = self.city.total_cost
+            affected, undo, deltas = choice(list(operators.OPERATORS.values()))(self.city)
+            previous_costs = [(index, self.city.costs[index]) for index in affected]
+            self.city.update_cost(affected, deltas)
+            self.city.revert(undo, previous_costs, total_cost)
+
+            self.assertEqual([drone.parcels for drone in self.city.drones], routes)
+            self.assertEqual(self.city.costs, costs)
+            self.assertEqual(self.city.total_cost, total_cost)
+
+        assigned = [id(parcel) for drone in self.city.drones for parcel in drone.parcels]
+        self.assertEqual(sorted(assigned), sorted(id(parcel) for parcel in self.city.parcels))
+
+
+    def test_routes(self):
+        """Checks that routes in compact form restore the same assignment."""
+
+        self.city += [self.drone0, self.drone1]
+        self.city += self.parcels
+        self.city.prepare_algorithm()
+        assignment = [list(drone.parcels) for drone in self.city.drones]
+        tour, ends = self.city.routes()
+
+        self.assertEqual(len(tour), len(self.city.parcels))
+        self.assertEqual(ends[-1], len(tour))
+
+        self.city.reassign_parcels()
+        self.city.set_routes((tour, ends))
+
+        self.assertEqual([drone.parcels for drone in self.city.drones], assignment)
+
+
+    def test_load(self):
+        """Checks that dumped city data loads into an equal city with whole drone specs."""
+
+        self.city += [Drone(3, max_capacity=7, max_speed=9, max_fuel=4, altitude=20), Drone(4)]
+        self.city += [self.parcel1, self.parcel2]
+        data = json.loads(json.dumps(self.city.dump(), allow_nan=False))
+
+        city = City()
+        city.load(data)
+
+        self.assertEqual(city.dump(), data)
+        self.assertEqual((city.drones[0].max_fuel, city.drones[0].altitude), (4, 20))
+        self.assertEqual(city.drones[0].base, city.position)
+        self.assertIsNone(data['drones'][1]['max_capacity'])
+        self.assertEqual(city.drones[1].max_capacity, inf)
+
+
+    def test_loaders(self):
+        """Checks that parcel files load from explicit paths and GPS coordinates are projected."""
+
+        self.city.rload('berlin52.txt')
+        parcels = [(parcel.number, parcel.position) for parcel in self.city.parcels]
+        city = City()
+        city.rload(os.path.join('test_TSP', 'raw_test', 'berlin52.txt'))
+
+        self.assertEqual([(parcel.number, parcel.position) for parcel in city.parcels], parcels)
+        self.assertEqual((city.solution, len(parcels), parcels[0]), (7542, 52, (1, (565, 575))))
+        self.assertEqual(city.position, parcels[-1][1])
+
+        source = os.path.abspath(os.path.join('test_TSP', 'raw_test', 'berlin52.txt'))
+        directory = os.getcwd()
+        with tempfile.TemporaryDirectory() as working_directory:
+            with open(source) as raw_file, open(os.path.join(working_directory, 'big.txt'),
+                                                'w') as copy:
+                copy.write(raw_file.read())
+            os.chdir(working_directory)
+            try:
+                city.rload('big.txt') # A bare name of a file in the working directory.
+            finally:
+                os.chdir(directory)
+        self.assertEqual([(parcel.number, parcel.position) for parcel in city.parcels], parcels)
+
+        city.cload(os.path.join('test_TSP', 'coord_test', 'ulysses22.txt'))
+        with open(os.path.join('test_TSP', 'coord_test', 'ulysses22.txt')) as coord_file:
+            rows = [line.split() for line in coord_file.read().split('\n')[1:] if line]
+        th0 = sum(float(row[1]) for row in rows) / len(rows)
+        self.assertEqual(len(city.parcels), len(rows))
+        for parcel, (number, latitude, longitude) in zip(city.parcels, rows):
+            self.assertEqual(parcel.number, int(number))
+            self.assertEqual(parcel.position.x,
+                             round(6371000 * radians(float(longitude)) * cos(radians(th0))))
+            self.assertEqual(parcel.position.y, round(6371000 * radians(float(latitude))))
+
+
+    def test_binary(self):
+        """Checks that problems and routes survive the binary format, read as memory maps."""
+
+        self.city += [self.drone0, self.drone1, Drone(3, max_fuel=4, split='optimal')]
+        self.city += [self.parcel1, self.parcel2]
+        self.city += [Parcel(n, Pos(n % 7, n // 7), n % 4) for n in range(3, 30)]
+        self.drone0 += self.city.parcels[5:9]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'city.bin')
+            self.city.bstore(path)
+            city = City()
+            city.bload(path)
+            meta, arrays = binary.read(path)
+
+            self.assertEqual(city.dump(), self.city.dump())
+            self.assertEqual([[parcel.number for parcel in drone.parcels] for drone in city.drones],
+                             [[parcel.number for parcel in drone.parcels]
+                              for drone in self.city.drones])
+            self.assertEqual(meta['splits'], ['greedy', 'greedy', 'optimal'])
+            self.assertEqual(arrays['parcel_positions'].shape, (29, 2))
+            self.assertFalse(arrays['tour'].flags.writeable)
+            del arrays
+
+            self.city.bstore(path, legs=True)
+            city = City()
+            city.bload(path)
+
+            self.assertIsInstance(city.legs.arrays[0], np.memmap)
+            self.assertEqual(list(map(list, city.legs.distances)),
+                             list(map(list, self.city.legs.distances)))
+            self.assertIs(city.drones[0].legs, city.legs)
+            city.full_simulated_annealing(iterations=100, test=True)
+            self.assertIsInstance(city.legs.arrays[0], np.memmap)
+
+            with open(path, 'wb') as binary_file:
+                binary_file.write(b'{}')
+            self.assertRaises(ValueError, city.bload, path)
+
+
+    def test_share(self):
+        """Checks that an attached city uses legs tables in shared memory and costs the same."""
+
+        self.city += [self.drone0, self.drone1]
+        self.city += self.parcels
+        self.city.prepare_algorithm()
+        handle, blocks = self.city.share()
+        try:
+            city = City()
+            city.attach(pickle.loads(pickle.dumps(handle)))
+            city.set_routes(self.city.routes())
+
+            self.assertEqual(city.metric, 'simple')
+            self.assertIsInstance(city.legs.distances[0], memoryview)
+            self.assertEqual(list(map(list, city.legs.distances)),
+                             list(map(list, self.city.legs.distances)))
+            self.assertEqual(city.costs, self.city.costs)
+            self.assertIs(city.drones[0].legs, city.legs)
+            del city
+        finally:
+            shared.release(blocks, unlink=True)
+
+
+    def test_multistart(self):
+        """Checks that the best of independent chains is applied to the city."""
+
+        self.city += [self.drone0, self.drone1]
+        self.city += self.parcels
+
+        best, chains = self.city.multistart(chains=3, workers=2, seeds=[1, 2, 3], iterations=300)
+
+        self.assertEqual([chain['seed'] for chain in chains], [1, 2, 3])
+        self.assertEqual(best['cost'], min(chain['cost'] for chain in chains))
+        self.assertTrue(all(chain['iterations'] > 0 for chain in chains))
+        self.assertAlmostEqual(self.city.total_cost, best['cost'])
+        assigned = sorted(parcel.number for drone in self.city.drones for parcel in drone.parcels)
+        self.assertEqual(assigned, sorted(parcel.number for parcel in self.city.parcels))
+
+
+    def test_multistart_drones(self):
+        """Checks that workers keep drones' own bases and winds (costs match the city's)."""
+
+        city = City(position=Pos(0, 0), wind=(3, 4))
+        city += [Drone(0, max_speed=4), Drone(1, base=Pos(50, 50), wind=(1, 1))]
+        city += self.parcels
+
+        best, _ = city.multistart(chains=2, workers=2, seeds=[1, 2], iterations=200)
+
+        self.assertAlmostEqual(city.total_cost, best['cost'])
+        meta, arrays = city.pack()
+        city.unpack(meta, arrays)
+        self.assertEqual([(drone.base, drone.wind) for drone in city.drones],
+                         [(Pos(0, 0), (0, 0)), (Pos(50, 50), (1, 1))])
+
+
+    def test_parallel_tempering(self):
+        """Checks that replica exchange returns a complete solution and swap statistics."""
+
+        self.city += [self.drone0, self.drone1]
+        self.city += self.parcels
+
+        result = self.city.parallel_tempering(replicas=3, rounds=5, sweep=50, workers=2,
+                                              swap_seed=0)
+
+        self.assertEqual(len(result['temperatures']), 3)
+        self.assertEqual(len(result['swap_rates']), 2)
+        self.assertLessEqual(result['best_cost'], result['cost'] + 1e-9)
+        self.assertAlmostEqual(self.city.total_cost, result['cost'])
+        assigned = sorted(parcel.number for drone in self.city.drones for parcel in drone.parcels)
+        self.assertEqual(assigned, sorted(parcel.number for parcel in self.city.parcels))
+
+
+    def test_observers(self):
+        """Checks that registered observers receive sampled events."""
+
+        events = []
+        self.city += [self.drone0, self.drone1]
+        self.city += [self.parcel1, self.parcel2]
+        self.city.observers.append(lambda city, event, **data: events.append(event))
+
+        self.city.full_simulated_annealing(iterations=100, test=True, every=10)
+
+        self.assertEqual(events[0], 'start')
+        self.assertEqual(events[-1], 'end')
+        self.assertEqual(events.count('sample'), self.city.iterations // 10)
+        self.assertGreaterEqual(events.count('temperature'), 10)
+        self.assertIn('cost', events)
+
+
+    def test_recorder(self):
+        """Checks that history is recorded only when asked for and stays bounded on long runs."""
+
+        self.city.recorder.capacity = 16
+        self.city += [self.drone0, self.drone1]
+        self.city += self.parcels
+
+        self.city.full_simulated_annealing(iterations=100, test=True, every=1)
+        self.assertEqual(self.city.observers, [])
+        self.assertEqual(len(self.city.recorder.iterations), 0)
+
+        self.city.iterations = 0
+        self.city.observers.append(self.city.recorder)
+        self.city.full_simulated_annealing(iterations=1000, test=True, every=1)
+
+        recorder = self.city.recorder
+        self.assertLess(len(recorder.iterations), 16)
+        self.assertEqual(recorder.iterations[0], 1)
+        self.assertEqual(recorder.iterations[1] - recorder.iterations[0], recorder.stride)
+        for values in recorder.history.values():
+            self.assertEqual(len(values), len(recorder.iterations))
+        self.assertEqual(min(recorder.history['best']), recorder.history['best'][-1])
+
+
+    def test_best_solution(self):
+        """Checks that the best solution is kept and applied at the end of annealing."""
+
+        seed(0)
+        self.city += [self.drone0, self.drone1]
+        self.city += self.parcels
+        costs = []
+        self.city.observers.append(lambda city, event, **data: costs.append(city.total_cost)
+                                   if event == 'sample' else None)
+
+        self.city.full_simulated_annealing(initial_temperature=1000, final_temperature=1,
+                                           iterations=300, test=True, every=1)
+
+        best_cost, best_routes = self.city.best_solution
+        self.assertAlmostEqual(best_cost, min(costs))
+        self.assertAlmostEqual(self.city.total_cost, best_cost)
+        self.assertEqual(self.city.routes(), best_routes)
+
+
+    def test_checkpoint(self):
+        """Checks that an interrupted run resumed from its checkpoint ends like a full run."""
+
+        class Interrupt(object):
+            def start(self, city):
+                pass
+            def __call__(self, city):
+                return city.iterations >= 500
+
+        self.city += [self.drone0, self.drone1]
+        self.city += self.parcels
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'checkpoint')
+            seed(0)
+            self.city.full_simulated_annealing(iterations=1000, test=True, checkpoint=path,
+                                               checkpoint_every=100, stop=[Interrupt()])
+            self.assertEqual(self.city.iterations, 500)
+            self.city.iterations = 0
+            self.city.full_simulated_annealing(iterations=1000, test=True, checkpoint=path,
+                                               resume=True)
+            resumed = self.city.routes(), self.city.iterations
+            seed(0)
+            self.city.iterations = 0
+            self.city.full_simulated_annealing(iterations=1000, test=True)
+
+        self.assertEqual(resumed, (self.city.routes(), self.city.iterations))
+
+        self.city += Parcel(30, Pos(9, 9), 1)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'checkpoint')
+            self.city.save_checkpoint(path, None)
+            self.city.parcels.pop()
+            self.city.prepare_algorithm()
+            self.assertRaises(ValueError, self.city.load_checkpoint, path)
+
+
+    def test_profile(self):
+        """Checks that profiling reports phases and operator counters and detaches itself."""
+
+        self.city += [self.drone0, self.drone1]
+        self.city += self.parcels
+
+        self.city.full_simulated_annealing(iterations=500, test=True, profile=True)
+
+        profile = json.loads(json.dumps(self.city.profile))
+        self.assertEqual(profile['iterations'], self.city.iterations)
+        self.assertGreater(profile['evaluations'], 0)
+        self.assertEqual(set(profile['phases']), {'move', 'cost', 'revert', 'acceptance', 'loop'})
+        self.assertTrue(all(time >= 0 for time in profile['phases'].values()))
+        self.assertAlmostEqual(sum(profile['phases'].values()), profile['wall_time'])
+        operators_used = profile['operators'].values()
+        self.assertEqual(sum(counters['proposed'] for counters in operators_used),
+                         self.city.iterations)
+        self.assertTrue(all(counters['proposed'] >= counters['accepted'] >= 0
+                            for counters in operators_used))
+        self.assertNotIn('iteration', vars(self.city))
+        self.assertNotIn('update', vars(self.city.selector))
+
+        def interrupt(city):
+            if city.iterations % 500 == 100:
+                raise KeyboardInterrupt
+        interrupt.start = lambda city: None
+        with self.assertRaises(KeyboardInterrupt):
+            self.city.full_simulated_annealing(iterations=500, test=True, profile=True,
+                                               stop=[interrupt])
+        self.assertNotIn('iteration', vars(self.city))
+        self.assertNotIn('update', vars(self.city.selector))
+
+
+    def test_incremental(self):
+        """Checks that parcels are added and removed without touching unaffected routes."""
+
+        seed(0)
+        self.city += [self.drone0, Drone(2), Drone(3)]
+        self.city += [Parcel(n, Pos(30 * (n % 3) - 30, n // 3), 3) for n in range(3, 30)]
+        self.city.prepare_algorithm()
+        for number, drone in enumerate(self.city.drones):
+            drone.parcels = self.city.parcels[number::3] # Columns x = -30, 0, 30.
+        self.city.calculate_cost()
+        routes = [list(drone.parcels) for drone in self.city.drones]
+
+        self.city.add_parcels([Parcel(30, Pos(31, 5), 3), Parcel(31, Pos(29, 10), 3)],
+                              iterations=300)
+
+        self.assertEqual([drone.parcels for drone in self.city.drones[:2]], routes[:2])
+        self.assertEqual(sorted(parcel.number for parcel in self.city.drones[2].parcels),
+                         list(range(5, 30, 3)) + [30, 31])
+        self.assertEqual([parcel.index for parcel in self.city.parcels], list(range(1, 30)))
+        self.assertAlmostEqual(self.city.total_cost,
+                               sum(drone.path_length for drone in self.city.drones))
+        self.assertAlmostEqual(self.city.total_cost, sum(self.city.costs))
+
+        self.city.remove_parcels([30, self.city.parcels[0]], iterations=300)
+
+        self.assertEqual(self.city.drones[1].parcels, routes[1])
+        assigned = sorted(parcel.number for drone in self.city.drones for parcel in drone.parcels)
+        self.assertEqual(assigned, list(range(4, 30)) + [31])
+        self.assertEqual([parcel.index for parcel in self.city.parcels], list(range(1, 28)))
+        self.assertEqual(self.city.legs.distances, Legs(Pos(0, 0), self.city.parcels).distances)
+        self.assertAlmostEqual(self.city.total_cost,
+                               sum(drone.path_length for drone in self.city.drones))
+
+
+    def test_incremental_edge_cases(self):
+        """Checks that the first order of an empty plan and an emptied plan can be added."""
+
+        seed(0)
+        self.city += self.drone0
+
+        self.city.add_parcels([self.parcel1], iterations=50)
+
+        self.assertEqual(self.city.drones[0].parcels, [self.parcel1])
+        self.assertAlmostEqual(self.city.total_cost, self.drone0.path_length)
+
+        self.city.remove_parcels([1], iterations=50)
+        self.city.add_parcels([self.parcel2], iterations=50)
+
+        self.assertEqual(self.city.drones[0].parcels, [self.parcel2])
+        self.assertEqual(self.parcel2.index, 1)
+        self.assertAlmostEqual(self.city.total_cost, self.drone0.path_length)
+
+
+    def test_update_drone(self):
+        """Checks that a changed drone is re-evaluated and unknown parameters are refused."""
+
+        self.city += [self.drone0, Drone(2, max_capacity=50)]
+        self.city += self.parcels
+        self.city.metric = 'full'
+        self.city.full_simulated_annealing(iterations=300, test=True)
+
+        self.city.update_drone(2, max_speed=5, iterations=100)
+
+        self.assertEqual(self.city.drones[1].max_speed, 5)
+        self.assertAlmostEqual(self.city.total_cost,
+                               sum(drone.total_time ** 2 for drone in self.city.drones))
+        with self.assertRaises(ValueError):
+            self.city.update_drone(2, colour='red')
+        with self.assertRaises(ValueError):
+            self.city.update_drone(99, max_speed=5)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,91 @@
+"""Decomposition module tests."""
+
+
+from random import seed
+import unittest
+
+from City import City
+from common import Position as Pos
+import decomposition
+from Drone import Drone
+from Parcel import Parcel
+
+
+class TestDecomposition(unittest.TestCase):
+    """Class provides tests for cluster-first, route-second solving."""
+
+
+    def setUp(self):
+        """Prepare environment for testing."""
+
+        self.city = City(position=Pos(0, 0), metric='simple')
+        self.city += [Drone(1, max_capacity=50), Drone(2, max_capacity=50)]
+        self.city += [Parcel(n, Pos(10 * (n % 8) - 35, 10 * (n // 8) - 35), 3)
+                      for n in range(1, 65)]
+
+
+    def test_partitions(self):
+        """Check that every partition covers each parcel exactly once."""
+
+        seed(0)
+        for method, partition in decomposition.PARTITIONS.items():
+            parts = partition(self.city, 4)
+
+            self.assertEqual(len(parts), 4, method)
+            self.assertEqual(sorted(parcel.number for part in parts for parcel in part),
+                             list(range(1, 65)), method)
+
+
+    def test_rounds(self):
+        """Check that boundary passes pair every two neighbouring clusters once."""
+
+        for count in range(2, 8):
+            rounds = decomposition.rounds(count)
+            pairs = [pair for pairs in rounds for pair in pairs]
+
+            self.assertEqual(sorted(pairs), sorted((i, (i + 1) % count) for i in range(count))
+                             if count > 2 else [(0, 1)])
+            for pairs in rounds:
+                clusters = [cluster for pair in pairs for cluster in pair]
+                self.assertEqual(len(clusters), len(set(clusters)))
+        self.assertEqual(decomposition.rounds(1), [])
+
+
+    def test_pack(self):
+        """Check that sub-problems keep drones' own bases and winds."""
+
+        self.city.drones[1].base = Pos(5, 5)
+        self.city.drones[1].wind = (1, -1)
+        part = City()
+        part.unpack(*decomposition.pack(self.city, self.city.parcels[:10]))
+
+        self.assertEqual([(drone.base, drone.wind) for drone in part.drones],
+                         [(Pos(0, 0), (0, 0)), (Pos(5, 5), (1, -1))])
+        self.assertEqual(len(part.parcels), 10)
+
+
+    def test_splice(self):
+        """Check that a part of a route is replaced in place of its first parcel."""
+
+        self.assertEqual(decomposition.splice([1, 2, 3, 4, 5], {2, 4}, [6, 4, 2]),
+                         [1, 6, 4, 2, 3, 5])
+        self.assertEqual(decomposition.splice([1, 3], {2}, [2]), [1, 3, 2])
+
+
+    def test_solve(self):
+        """Check that decomposition assigns each parcel once and polishing does not hurt."""
+
+        seed(0)
+        stats = decomposition.solve(self.city, clusters=4, workers=2, iterations=2000,
+                                    initial_temperature='auto')
+
+        assigned = sorted(parcel.number for drone in self.city.drones for parcel in drone.parcels)
+        self.assertEqual(assigned, list(range(1, 65)))
+        self.assertEqual(sum(stats['clusters']), 64)
+        self.assertAlmostEqual(stats['cost'],
+                               sum(drone.path_length for drone in self.city.drones))
+        self.assertLessEqual(stats['cost'], stats['stitched_cost'] * 1.01)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,14 @@
 """Drone module tests."""
 
 
+from array import array
 import unittest
 
 from common import Position as Pos
 from Drone import Drone
+from Legs import Legs
 from Parcel import Parcel
+from TripCache import TripCache
 
 
 class TestDrone(unittest.TestCase):
@@ -61,5 +64,127 @@ class TestDrone(unittest.TestCase):
         self.assertEqual(len(self.drone1.path), 4)
 
 
+    def test_twoopt(self):
+        """Check that 2-opt reverses a slice in place and reversing it again undoes it."""
+
+        self.drone0 += [Parcel(n, Pos(n, n), 1) for n in range(10)]
+        parcels = list(self.drone0.parcels)
+
+        i, k = self.drone0.twoopt()
+
+        self.assertEqual(self.drone0.parcels, parcels[:i] + parcels[i:k][::-1] + parcels[k:])
+        self.drone0.reverse(i, k)
+        self.assertEqual(self.drone0.parcels, parcels)
+
+
+    def test_legs(self):
+        """Check that precomputed legs give the same results as direct computations."""
+
+        drone = Drone(2, wind=(1, -2), max_capacity=12)
+        drone += [Parcel(n, Pos(100 * (n % 4), -50 * n), n % 5) for n in range(12)]
+        path_length, total_time = drone.path_length, drone.total_time
+
+        drone.legs = Legs(drone.base, drone.parcels)
+
+        self.assertEqual([parcel.index for parcel in drone.parcels], list(range(1, 13)))
+        self.assertIsInstance(drone.legs.distances[0], array)
+        self.assertEqual(drone.legs.xs[1:4], array('d', [0, 100, 200]))
+        self.assertFalse(hasattr(drone.legs, '__dict__'))
+        self.assertEqual(drone.path_length, path_length)
+        self.assertEqual(drone.total_time, total_time)
+
+
+    def test_split(self):
+        """Check that optimal split never loses to greedy split and respects capacity."""
+
+        parcels = [Parcel(n, Pos(150 * (n % 5) - 300, 100 * (n % 3)), 2 + n % 4) for n in range(15)]
+        for max_capacity in [6, 9, 14]:
+            greedy = Drone(1, max_capacity=max_capacity, split='greedy')
+            optimal = Drone(2, max_capacity=max_capacity, split='optimal')
+            greedy += parcels
+            optimal += parcels
+
+            self.assertLessEqual(optimal.path_length, greedy.path_length)
+            self.assertLessEqual(optimal.total_time, greedy.total_time)
+            self.assertEqual([parcel for trip in optimal.trips for parcel in trip], parcels)
+            for trip in optimal.trips:
+                self.assertLessEqual(sum(parcel.weight for parcel in trip), max_capacity)
+
+
+    def test_trip_cache(self):
+        """Check that drones with equal specs share cached trips and results do not change."""
+
+        parcels = [Parcel(n, Pos(100 * (n % 4), -50 * n), n % 5) for n in range(12)]
+        legs = Legs(Pos(0, 0), parcels)
+        drone1 = Drone(1, wind=(1, -2), max_capacity=12, split='optimal')
+        drone2 = Drone(2, wind=(1, -2), max_capacity=12, split='optimal')
+        drone1 += parcels
+        total_time = drone1.total_time
+        drone1.legs = drone2.legs = legs
+
+        self.assertEqual(drone1.total_time, total_time)
+        misses = legs.cache.misses
+        drone2 += parcels
+        self.assertEqual(drone2.total_time, total_time)
+        self.assertEqual(legs.cache.misses, misses)
+        self.assertEqual(legs.cache.stats()['hit_rate'], 0.5)
+
+        drone2.max_speed = 25
+        self.assertNotEqual(drone2.total_time, total_time)
+        self.assertGreater(legs.cache.misses, misses)
+
+
+    def test_trip_cache_bound(self):
+        """Check that the least recently used trips are evicted first."""
+
+        cache = TripCache(maxsize=2)
+        for key in ['a', 'b', 'a', 'c']:
+            cache.get(key, str.upper, key)
+
+        self.assertEqual(list(cache.entries), ['a', 'c'])
+        self.assertEqual((cache.hits, cache.misses), (1, 3))
+
+
+    def test_winds(self):
+        """Check that tabulated wind components match ground speeds and depend on direction."""
+
+        parcels = [Parcel(n, Pos(100 * (n % 4), -50 * n), n % 5) for n in range(1, 6)]
+        legs = Legs(Pos(0, 0), parcels)
+        drone = Drone(1, wind=(3, -4))
+        tailwinds, crosswinds = legs.winds(drone.wind)
+
+        for i, start in enumerate([None] + parcels):
+            for j, end in enumerate([None] + parcels):
+                if i != j:
+                    heading = drone.leg(start, end)[1]
+                    speed = tailwinds[i][j] + (drone.speed ** 2 - crosswinds[i][j]) ** 0.5
+                    self.assertAlmostEqual(speed, drone.ground_speed(heading))
+                    self.assertAlmostEqual(tailwinds[i][j], -tailwinds[j][i])
+        self.assertIs(legs.winds([3, -4])[0], tailwinds)
+
+
+    def test_legs_update(self):
+        """Check that extended and reduced legs equal legs computed from scratch."""
+
+        parcels = [Parcel(n, Pos(100 * (n % 4), -50 * n), n % 5) for n in range(1, 9)]
+        legs = Legs(Pos(0, 0), parcels[:5])
+        legs.winds((3, -4))
+        legs.extend(parcels[5:])
+
+        self.assertEqual([parcel.index for parcel in parcels], list(range(1, 9)))
+        fresh = Legs(Pos(0, 0), parcels)
+        self.assertEqual((legs.distances, legs.headings), (fresh.distances, fresh.headings))
+        self.assertEqual(legs.winds((3, -4)), fresh.winds((3, -4)))
+
+        legs.remove([parcels[1], parcels[6]], parcels[:1] + parcels[2:6] + parcels[7:])
+
+        remaining = parcels[:1] + parcels[2:6] + parcels[7:]
+        self.assertEqual([parcel.index for parcel in remaining], list(range(1, 7)))
+        fresh = Legs(Pos(0, 0), remaining)
+        self.assertEqual((legs.distances, legs.headings, legs.weights),
+                         (fresh.distances, fresh.headings, fresh.weights))
+        self.assertEqual(legs.winds((3, -4)), fresh.winds((3, -4)))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,143 @@
+"""Operators module tests."""
+
+
+import unittest
+from random import random, seed
+
+from City import City
+from common import Position as Pos
+from common import dist
+from Drone import Drone
+from Neighbours import Neighbours
+from Parcel import Parcel
+import operators
+
+
+class TestOperators(unittest.TestCase):
+    """Class provides tests for neighbourhood operators."""
+
+
+    def setUp(self):
+        """Prepare environment for testing."""
+
+        seed(0)
+        self.city = City(metric='simple')
+        self.city += [Drone(n) for n in range(3)]
+        self.city += [Parcel(n, Pos(37 * n % 101, 53 * n % 97), n % 3) for n in range(1, 25)]
+        self.city.prepare_algorithm()
+
+
+    def test_deltas(self):
+        """Check that local deltas of every operator match recalculated costs."""
+
+        for name, operator in operators.OPERATORS.items():
+            for _ in range(100):
+                costs = list(self.city.costs)
+                affected, undo, deltas = operator(self.city)
+                self.assertIsNotNone(deltas, name)
+                for index, delta in zip(affected, deltas):
+                    costs[index] += delta
+                for index in affected:
+                    self.assertAlmostEqual(self.city.drone_cost(self.city.drones[index]),
+                                           costs[index], msg=name)
+                self.city.calculate_cost()
+
+
+    def test_undo(self):
+        """Check that every operator is undone and redone exactly, keeping all parcels assigned."""
+
+        for name, operator in operators.OPERATORS.items():
+            for _ in range(100):
+                operator(self.city)
+                assigned = sorted(parcel.number for drone in self.city.drones
+                                  for parcel in drone.parcels)
+                self.assertEqual(assigned, list(range(1, 25)), name)
+                routes = [list(drone.parcels) for drone in self.city.drones]
+                _, undo, _ = operator(self.city)
+                moved = [list(drone.parcels) for drone in self.city.drones]
+                operators.undo(self.city, undo)
+                self.assertEqual([drone.parcels for drone in self.city.drones], routes, name)
+                operators.redo(self.city, undo)
+                self.assertEqual([drone.parcels for drone in self.city.drones], moved, name)
+
+
+    def test_locate(self):
+        """Check that moves and their undos keep drones of parcels in the placement map."""
+
+        for name, operator in operators.OPERATORS.items():
+            for _ in range(100):
+                _, undo, _ = operator(self.city)
+                if undo is not None and random() < 0.5:
+                    operators.undo(self.city, undo)
+                for index, drone in enumerate(self.city.drones):
+                    for position, parcel in enumerate(drone.parcels):
+                        self.assertIs(self.city.placement[parcel.index][0], drone, name)
+                        self.assertEqual(operators.locate(self.city, parcel), (index, position))
+
+
+    def test_capacity(self):
+        """Check that deltas are not reported for drones with limited capacity."""
+
+        self.city.drones[0].max_capacity = 10
+        self.city.drones[1].max_capacity = 10
+        self.city.drones[2].max_capacity = 10
+
+        for operator in operators.OPERATORS.values():
+            self.assertFalse(operator(self.city)[2])
+
+
+    def test_neighbours(self):
+        """Check that candidate lists hold the nearest parcels (compared with brute force)."""
+
+        neighbours = Neighbours(self.city.parcels, k=5)
+
+        for parcel in self.city.parcels:
+            distances = sorted(dist(parcel.position, other.position)
+                               for other in self.city.parcels if other is not parcel)
+            candidates = neighbours.candidates[parcel.index]
+            self.assertEqual([dist(parcel.position, other.position) for other in candidates],
+                             distances[:5])
+
+
+    def test_neighbours_update(self):
+        """Check that added and removed parcels leave the same lists as a rebuilt index."""
+
+        def distances(neighbours, parcels):
+            return [[dist(parcel.position, other.position)
+                     for other in neighbours.candidates[parcel.index]] for parcel in parcels]
+
+        parcels = [Parcel(n, Pos(37 * n % 101, 53 * n % 97), 1) for n in range(1, 41)]
+        neighbours = Neighbours([], k=5)
+        for start, stop in ((0, 3), (3, 20), (20, 40)):
+            for index, parcel in enumerate(parcels[start:stop], start + 1):
+                parcel.index = index
+            neighbours.add(parcels[start:stop])
+            self.assertEqual(distances(neighbours, parcels[:stop]),
+                             distances(Neighbours(parcels[:stop], k=5), parcels[:stop]))
+
+        removed = set(parcels[::3])
+        remaining = [parcel for parcel in parcels if parcel not in removed]
+        neighbours.remove(removed, remaining)
+        for index, parcel in enumerate(remaining, 1):
+            parcel.index = index
+        self.assertEqual(distances(neighbours, remaining),
+                         distances(Neighbours(remaining, k=5), remaining))
+        self.assertTrue(all(neighbours.reach >= distance[-1]
+                            for distance in distances(neighbours, remaining)))
+
+
+    def test_selector(self):
+        """Check that rejected operators lose weight but never drop below the floor."""
+
+        selector = operators.Selector(['twoopt', 'swap'], reaction=0.5, floor=0.1)
+        for _ in range(10):
+            selector.update(0, False)
+            selector.update(1, True)
+
+        self.assertEqual(selector.weights[0], 0.1)
+        self.assertAlmostEqual(selector.weights[1], 1)
+        self.assertIn(selector.choose(), [0, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+"""Schedules module tests."""
+
+
+import unittest
+from math import exp
+from random import seed
+
+from City import City
+from common import Position as Pos
+from Drone import Drone
+from Parcel import Parcel
+import schedules
+
+
+class TestSchedules(unittest.TestCase):
+    """Class provides tests for cooling schedules and stopping criteria."""
+
+
+    def setUp(self):
+        """Prepare environment for testing."""
+
+        seed(0)
+        self.city = City(position=Pos(0, 0), metric='simple')
+        self.city += [Drone(1, max_capacity=100, max_speed=10),
+                      Drone(2, max_capacity=100, max_speed=10)]
+        self.city += [Parcel(n, Pos(n % 7, n // 7), 3) for n in range(1, 30)]
+
+
+    def test_schedules(self):
+        """Checks that every schedule cools down and finishes within its iterations."""
+
+        for name in schedules.SCHEDULES:
+            self.city.iterations = 0
+            self.city.full_simulated_annealing(test=True, iterations=500, schedule=name)
+
+            if name != 'reheating':
+                self.assertLessEqual(self.city.iterations, 500 + 1, name)
+            assigned = sorted(parcel.number
+                              for drone in self.city.drones for parcel in drone.parcels)
+            self.assertEqual(assigned, list(range(1, 30)))
+
+
+    def test_lundy_mees(self):
+        """Checks that Lundy-Mees schedule reaches the final temperature in given iterations."""
+
+        schedule = schedules.LundyMees(10, 0.001, 1000)
+        self.city.prepare_algorithm()
+        schedule.start(self.city)
+        for _ in range(1000):
+            schedule.update(False, False)
+
+        self.assertAlmostEqual(schedule.temperature, 0.001)
+
+
+    def test_reheating(self):
+        """Checks that temperature is raised after stagnation, at most limit times."""
+
+        schedule = schedules.Reheating(10, 0.001, 1000, patience=10, factor=5, limit=2)
+        self.city.prepare_algorithm()
+        schedule.start(self.city)
+        temperatures = []
+        for _ in range(100):
+            schedule.update(False, False)
+            temperatures.append(schedule.temperature)
+
+        raised = sum(after > before for before, after in zip(temperatures[:-1], temperatures[1:]))
+        self.assertEqual(raised, 2)
+
+
+    def test_calibrate(self):
+        """Checks that auto temperature accepts an average uphill move with given probability."""
+
+        schedule = schedules.Geometric('auto', 'auto', 1000, acceptance=0.5)
+        self.city.prepare_algorithm()
+        routes = self.city.routes()
+        seed(1)
+        schedule.start(self.city)
+        seed(1)
+        uphill = schedules.calibrate(self.city)
+
+        self.assertEqual(self.city.routes(), routes)
+        self.assertAlmostEqual(exp(-uphill / (schedule.initial * self.city.scale)), 0.5)
+        self.assertAlmostEqual(schedule.final, schedule.initial / 10_000)
+
+
+    def test_abstract(self):
+        """Checks that the base schedule cannot be used without a cooling rule."""
+
+        with self.assertRaises(TypeError):
+            schedules.Schedule()
+
+
+    def test_stop(self):
+        """Checks that stopping criteria end annealing early."""
+
+        self.city.full_simulated_annealing(test=True, iterations=10 ** 9,
+                                           stop=[schedules.WallClock(0.2)])
+        self.assertLess(self.city.iterations, 10 ** 9)
+
+        self.city.iterations = 0
+        self.city.full_simulated_annealing(test=True, stop=[schedules.NoImprovement(50)])
+        self.assertLess(self.city.iterations, 10_000)
+
+        self.city.iterations = 0
+        self.city.best_total_cost = 0 # Unbeatable best of an earlier run is not counted.
+        self.city.full_simulated_annealing(test=True, stop=[schedules.NoImprovement(50)])
+        self.assertGreater(self.city.iterations, 50)
+        self.assertEqual(self.city.best_total_cost, self.city.best_solution[0])
+
+        self.city.iterations = 0
+        self.city.full_simulated_annealing(test=True, stop=[schedules.TargetCost(10 ** 9)])
+        self.assertEqual(self.city.iterations, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()